@@ -0,0 +1,181 @@
+# A small reduced ordered binary decision diagram package, used by the symbolic engine.
+# Nodes are integers: 0 and 1 are the terminals and every other node n tests variable var[n],
+# following high[n] if the variable is true and low[n] otherwise. Variables are ordered by their number.
+
+
+class BDD:
+    __slots__ = ('num_vars', 'var', 'low', 'high', 'unique', 'ite_cache', 'exists_cache', 'rename_cache')
+
+    FALSE = 0
+    TRUE = 1
+
+    def __init__(self, num_vars):
+        self.num_vars = num_vars
+        self.var = [num_vars, num_vars]
+        self.low = [0, 1]
+        self.high = [0, 1]
+        self.unique = {}
+        self.ite_cache = {}
+        self.exists_cache = {}
+        self.rename_cache = {}
+
+    def __len__(self):
+        return len(self.var)
+
+    # Returns the node testing v with the given cofactors
+    def node(self, v, low, high):
+        if low == high:
+            return low
+        key = (v, low, high)
+        if key not in self.unique:
+            self.unique[key] = len(self.var)
+            self.var.append(v)
+            self.low.append(low)
+            self.high.append(high)
+        return self.unique[key]
+
+    # Returns the function of a single variable
+    def variable(self, v):
+        return self.node(v, 0, 1)
+
+    def cofactors(self, u, v):
+        if self.var[u] == v:
+            return self.low[u], self.high[u]
+        return u, u
+
+    # If-then-else: the function f ? g : h
+    def ite(self, f, g, h):
+        if f == 1:
+            return g
+        if f == 0:
+            return h
+        if g == h:
+            return g
+        if g == 1 and h == 0:
+            return f
+        key = (f, g, h)
+        if key in self.ite_cache:
+            return self.ite_cache[key]
+        v = min(self.var[f], self.var[g], self.var[h])
+        f0, f1 = self.cofactors(f, v)
+        g0, g1 = self.cofactors(g, v)
+        h0, h1 = self.cofactors(h, v)
+        result = self.node(v, self.ite(f0, g0, h0), self.ite(f1, g1, h1))
+        self.ite_cache[key] = result
+        return result
+
+    def neg(self, f):
+        return self.ite(f, 0, 1)
+
+    def conj(self, *fs):
+        result = 1
+        for f in fs:
+            result = self.ite(result, f, 0)
+        return result
+
+    def disj(self, *fs):
+        result = 0
+        for f in fs:
+            result = self.ite(result, 1, f)
+        return result
+
+    def implies(self, f, g):
+        return self.ite(f, g, 1)
+
+    def equiv(self, f, g):
+        return self.ite(f, g, self.neg(g))
+
+    # Existential quantification over a frozenset of variables
+    def exists(self, f, variables):
+        if f < 2:
+            return f
+        key = (f, variables)
+        if key in self.exists_cache:
+            return self.exists_cache[key]
+        low = self.exists(self.low[f], variables)
+        high = self.exists(self.high[f], variables)
+        if self.var[f] in variables:
+            result = self.ite(low, 1, high)
+        else:
+            result = self.node(self.var[f], low, high)
+        self.exists_cache[key] = result
+        return result
+
+    def forall(self, f, variables):
+        return self.neg(self.exists(self.neg(f), variables))
+
+    # Renames variables according to a tuple of (old, new) pairs
+    def rename(self, f, mapping):
+        renamed = dict(mapping)
+
+        def walk(u):
+            if u < 2:
+                return u
+            key = (u, mapping)
+            if key not in self.rename_cache:
+                v = renamed.get(self.var[u], self.var[u])
+                self.rename_cache[key] = self.ite(self.variable(v), walk(self.high[u]), walk(self.low[u]))
+            return self.rename_cache[key]
+
+        return walk(f)
+
+    # Fixes variables to the values in an assignment {variable: bool}
+    def restrict(self, f, assignment):
+        result = f
+        for v, value in assignment.items():
+            literal = self.variable(v) if value else self.neg(self.variable(v))
+            result = self.exists(self.conj(result, literal), frozenset([v]))
+        return result
+
+    # Returns one satisfying assignment {variable: bool} over the given variables, or None if f is false
+    def pick(self, f, variables):
+        if f == 0:
+            return None
+        assignment = {v: False for v in variables}
+        while f > 1:
+            if self.low[f] != 0:
+                assignment[self.var[f]] = False
+                f = self.low[f]
+            else:
+                assignment[self.var[f]] = True
+                f = self.high[f]
+        return assignment
+
+    # Yields every satisfying assignment over the given variables; f must only depend on them
+    def assignments(self, f, variables):
+        variables = sorted(variables)
+        stack = [(f, 0, {})]
+        while stack:
+            u, position, assignment = stack.pop()
+            if u == 0:
+                continue
+            if position == len(variables):
+                yield assignment
+                continue
+            v = variables[position]
+            low, high = self.cofactors(u, v)
+            for value, cofactor in ((True, high), (False, low)):
+                extended = dict(assignment)
+                extended[v] = value
+                stack.append((cofactor, position + 1, extended))
+
+    # Returns the number of satisfying assignments over the given variables; f must only depend on them
+    def count(self, f, variables):
+        variables = sorted(variables)
+        position = {v: i for i, v in enumerate(variables)}
+        cache = {}
+
+        def level(u):
+            if u < 2:
+                return len(variables)
+            return position[self.var[u]]
+
+        def paths(u):
+            if u < 2:
+                return u
+            if u not in cache:
+                low, high = self.low[u], self.high[u]
+                cache[u] = (paths(low) << (level(low) - level(u) - 1)) + (paths(high) << (level(high) - level(u) - 1))
+            return cache[u]
+
+        return paths(f) << level(f)
@@ -0,0 +1,51 @@
+import os
+import pickle
+import time
+
+# Checkpoints of long-running checks in real-time.py.
+# A check passes through stages (the enumeration of the maximal consistent sets, their classification into clusters
+# and irreflexive sets, and the model search), and at intervals writes the state of the current stage to a file as a
+# dictionary. The file is replaced atomically, so a check killed while writing leaves the previous checkpoint intact.
+
+CHECKPOINT_VERSION = 1
+
+
+class Checkpoint:
+
+    def __init__(self, path, interval=60.0, report=None):
+        self.path = path
+        self.interval = interval
+        self.report = report
+        self.last = time.monotonic()
+        self.saves = 0
+
+    # Checks if the interval has passed since the last save
+    def due(self):
+        return time.monotonic() - self.last >= self.interval
+
+    # Writes a state to the checkpoint file and reports the progress message with it
+    def save(self, state, message=None):
+        temporary = self.path + '.tmp'
+        with open(temporary, 'wb') as file:
+            pickle.dump((CHECKPOINT_VERSION, state), file, protocol=pickle.HIGHEST_PROTOCOL)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, self.path)
+        self.last = time.monotonic()
+        self.saves += 1
+        if message is not None and self.report is not None:
+            self.report(message)
+
+    # Returns the state in the checkpoint file, or None if there is no checkpoint yet
+    def load(self):
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, 'rb') as file:
+            version, state = pickle.load(file)
+        if version != CHECKPOINT_VERSION:
+            raise ValueError(f"The checkpoint {self.path} was written by an incompatible version.")
+        return state
+
+    # Returns the checkpoint of the k-th component of a formula checked component by component
+    def component(self, k):
+        return Checkpoint(f"{self.path}.{k}", self.interval, self.report)
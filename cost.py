@@ -0,0 +1,216 @@
+import argparse
+import importlib.util
+import json
+import os
+import time
+import tracemalloc
+from math import inf, log2
+
+from subformula_cache import CACHE, closure
+
+# Cost estimates and admission control shared by real-time.py and minkowski-spacetime.py.
+# The propositional connectives of a maximal consistent set are fixed by its atoms and temporal members, so there
+# are at most 2 ** variables of them, where variables counts the atoms and non-negated temporal members of the
+# closure. The runtime and peak memory of each engine are modelled as 2 ** (intercept + slope * variables), with the
+# intercept and slope fitted by calibrate to benchmark samples of the form returned by benchmark. An admission
+# policy maps an estimate to one of DECISIONS.
+
+TEMPORAL = 'FPGH'
+
+# Engines that enumerate masks of at most 64 closure members
+EXPLICIT_ENGINES = ('filtration', 'explicit')
+
+# For each flow and engine, the (intercept, slope) fits of log2 of the seconds and of the peak bytes on the number
+# of variables, fitted by calibrate to benchmarks of random formulas of up to 10 variables (up to 6 for Minkowski
+# spacetime). Half of the predicted runtimes were within a factor of 2 to 4 of the measured ones
+CALIBRATION = {
+    'real-line': {
+        'filtration': ((-12.27, 1.75), (11.21, 1.03)),
+        'tableau': ((-12.91, 0.95), (11.35, 0.84)),
+        'bdd': ((-11.46, 1.26), (12.48, 1.21)),
+    },
+    'minkowski': {
+        'explicit': ((-16.16, 3.24), (10.64, 1.2)),
+        'bdd': ((-12.87, 1.96), (12.25, 1.57)),
+    },
+}
+
+# Admission decisions, from the cheapest to the most expensive formulas
+DECISIONS = ('accept', 'queue', 'large', 'reject')
+
+# Thresholds of threshold_policy: formulas predicted to take longer than interactive_seconds are queued, those
+# taking longer than large_seconds or more than worker_memory bytes go to the large-worker pool, and those beyond
+# max_seconds or max_memory are rejected
+THRESHOLDS = {
+    'interactive_seconds': 1.0,
+    'large_seconds': 60.0,
+    'worker_memory': 1 << 30,
+    'max_seconds': 3600.0,
+    'max_memory': 16 << 30,
+}
+
+
+# Returns 2 ** exponent as a float, or inf where the float would overflow
+def exponential(exponent):
+    return 2.0 ** exponent if exponent < 1024 else inf
+
+
+# Returns the cost estimate of a parsed formula for a flow ('real-line' or 'minkowski') as a dictionary: the closure
+# size, the number of non-negated members and of temporal operators, the number of choice sets get_choice_set
+# enumerates, the bound on the maximal consistent sets, and the predicted seconds and peak bytes of each engine,
+# which are inf for formulas too large for a float. Only the closure is computed
+def estimate_cost(formula, flow, calibration=None):
+    closure_set = closure(formula)
+    members = [subformula for subformula in closure_set if subformula[0] != '~']
+    variables = sum(1 for member in members if len(member) == 1 or member[0] in TEMPORAL)
+    runtime = {}
+    memory = {}
+    for engine, (runtime_fit, memory_fit) in (calibration or CALIBRATION)[flow].items():
+        runtime[engine] = exponential(runtime_fit[0] + runtime_fit[1] * variables)
+        memory[engine] = exponential(memory_fit[0] + memory_fit[1] * variables)
+    return {
+        'closure_size': len(closure_set),
+        'members': len(members),
+        'temporal_operators': sum(1 for symbol in formula.formula if symbol in TEMPORAL),
+        'variables': variables,
+        'choice_sets': 2 ** len(members),
+        'mcs_bound': 2 ** variables,
+        'runtime': runtime,
+        'memory': memory,
+    }
+
+
+# The default admission policy: compares the predicted cost of an engine with THRESHOLDS; an infinite prediction
+# exceeds every threshold and is rejected
+def threshold_policy(estimate, engine, thresholds=THRESHOLDS):
+    seconds = estimate['runtime'][engine]
+    memory = estimate['memory'][engine]
+    if engine in EXPLICIT_ENGINES and estimate['members'] > 64:
+        return 'reject'
+    if seconds > thresholds['max_seconds'] or memory > thresholds['max_memory']:
+        return 'reject'
+    if seconds > thresholds['large_seconds'] or memory > thresholds['worker_memory']:
+        return 'large'
+    if seconds > thresholds['interactive_seconds']:
+        return 'queue'
+    return 'accept'
+
+
+# Returns the admission decision for checking a formula of the given estimate with an engine. policy is a hook
+# called with the estimate and the engine, returning one of DECISIONS
+def admit(estimate, engine, policy=threshold_policy):
+    decision = policy(estimate, engine)
+    if decision not in DECISIONS:
+        raise ValueError(f"Unknown admission decision {decision}.")
+    return decision
+
+
+# Runs the full check of the real-line program
+def check_real_line(formula, engine):
+    return formula.get_model(engine=engine, precheck=False)
+
+
+# Runs the full check of the Minkowski program
+def check_minkowski(formula, engine):
+    return formula.check_sat(engine=engine, precheck=False)
+
+
+CHECKS = {
+    'real-line': ('real-time.py', check_real_line),
+    'minkowski': ('minkowski-spacetime.py', check_minkowski),
+}
+
+
+# Returns the TemporalFormula class of the program checking a flow
+def load_formula_class(flow):
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), CHECKS[flow][0])
+    spec = importlib.util.spec_from_file_location(flow.replace('-', '_'), path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.TemporalFormula
+
+
+# Runs the full check of every formula string with every engine from an empty subformula cache; returns samples as
+# dictionaries of the flow, engine, variables, seconds and peak bytes. The peak is traced in a second run, as
+# tracing slows the check down
+def benchmark(formula_class, flow, formula_strings, engines):
+    check = CHECKS[flow][1]
+    samples = []
+    for formula_string in formula_strings:
+        for engine in engines:
+            CACHE.clear()
+            formula = formula_class(formula_string)
+            variables = estimate_cost(formula, flow)['variables']
+            start = time.perf_counter()
+            check(formula, engine)
+            seconds = time.perf_counter() - start
+            CACHE.clear()
+            tracemalloc.start()
+            check(formula_class(formula_string), engine)
+            memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            samples.append({'flow': flow, 'engine': engine, 'variables': variables, 'seconds': seconds,
+                            'memory': memory})
+    return samples
+
+
+# Returns the least squares (intercept, slope) of points (x, y); the slope of default is kept if all x are equal
+def fit_line(points, default):
+    if points == []:
+        return default
+    mean_x = sum(x for x, y in points) / len(points)
+    mean_y = sum(y for x, y in points) / len(points)
+    spread = sum((x - mean_x) ** 2 for x, y in points)
+    if spread == 0:
+        slope = default[1]
+    else:
+        slope = sum((x - mean_x) * (y - mean_y) for x, y in points) / spread
+    return (mean_y - slope * mean_x, slope)
+
+
+# Returns a calibration fitted to benchmark samples; the fits of engines without samples are taken from calibration
+def calibrate(samples, calibration=None):
+    calibration = calibration or CALIBRATION
+    fitted = {flow: dict(fits) for flow, fits in calibration.items()}
+    for flow, fits in calibration.items():
+        for engine, (runtime_fit, memory_fit) in fits.items():
+            chosen = [sample for sample in samples if sample['flow'] == flow and sample['engine'] == engine]
+            runtime_points = [(sample['variables'], log2(max(sample['seconds'], 1e-6))) for sample in chosen]
+            memory_points = [(sample['variables'], log2(max(sample['memory'], 1))) for sample in chosen]
+            fitted[flow][engine] = (fit_line(runtime_points, runtime_fit), fit_line(memory_points, memory_fit))
+    return fitted
+
+
+# Reads a calibration written by main; engines missing from the file keep the fits of CALIBRATION
+def read_calibration(path):
+    calibration = {flow: dict(fits) for flow, fits in CALIBRATION.items()}
+    with open(path) as file:
+        for flow, fits in json.load(file).items():
+            for engine, (runtime_fit, memory_fit) in fits.items():
+                calibration.setdefault(flow, {})[engine] = (tuple(runtime_fit), tuple(memory_fit))
+    return calibration
+
+
+# Benchmarks the formulas of a file, one per line, and writes the calibration fitted to them as JSON
+def main():
+    parser = argparse.ArgumentParser(description="Calibrates the cost estimates of the checkers.")
+    parser.add_argument('formulas', help="file of formulas to benchmark, one per line")
+    parser.add_argument('--flow', choices=list(CHECKS), default='real-line')
+    parser.add_argument('--engines', nargs='+', metavar='ENGINE',
+                        help="engines to benchmark (default: every engine of the flow)")
+    parser.add_argument('--output', metavar='FILE', help="write the calibration to FILE instead of printing it")
+    args = parser.parse_args()
+    with open(args.formulas) as file:
+        formula_strings = [line.strip() for line in file if line.strip()]
+    engines = args.engines or list(CALIBRATION[args.flow])
+    samples = benchmark(load_formula_class(args.flow), args.flow, formula_strings, engines)
+    calibration = json.dumps(calibrate(samples), indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(calibration + '\n')
+    else:
+        print(calibration)
+
+
+if __name__ == '__main__':
+    main()
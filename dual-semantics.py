@@ -0,0 +1,144 @@
+import argparse
+import importlib.util
+import os
+import sys
+import time
+
+from mcs_tables import restrict_tables
+
+# Checks a formula over both the real line and the irreflexive 2-dimensional Minkowski spacetime.
+# The two programs build the same closure, maximal consistent sets, access relation, clusters and irreflexive sets;
+# only their pruning differs. The sets kept for the real line, those before or after a set containing the formula,
+# are among those kept for Minkowski spacetime, those before a set after one containing the formula, and both are
+# closed under clusters. So the tables and the access matrix are built once with the Minkowski pruning, and the
+# real-line tables are restricted from them without computing anything again. Each check then gives the same answer
+# as its own program.
+
+
+# Loads one of the programs, whose file names are not module names. The module is registered under the given name,
+# so that worker processes can find the functions they are sent
+def load_program(name, file_name):
+    spec = importlib.util.spec_from_file_location(name, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                                     file_name))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+real_time = load_program('real_time', 'real-time.py')
+minkowski_spacetime = load_program('minkowski_spacetime', 'minkowski-spacetime.py')
+
+
+# Gives a formula of each program the tables computed for the Minkowski check, restricting them for the real line
+def share_tables(real_line, minkowski, pruning=True):
+    real_line.pruning = False
+    mcs_table = real_line.get_mcs_table()
+    if pruning:
+        mcs_table = minkowski.prune(mcs_table)
+    real_line.mcs_table = mcs_table
+    cluster_table = real_line.get_cluster_table()
+    access_matrix = real_line.get_access_matrix()
+    minkowski.closure_index = mcs_table.index
+    minkowski.mcs_table = mcs_table
+    minkowski.access_matrix = access_matrix
+    minkowski.cluster_table = cluster_table
+    minkowski.irref_rows = real_line.irref_rows
+    if not pruning:
+        return
+    sources = mcs_table.containing(real_line.formula)
+    rows = set(mcs_table.reachable(sources, True)) | set(mcs_table.reachable(sources, False))
+    real_line.mcs_table, real_line.cluster_table, real_line.irref_rows = \
+        restrict_tables(mcs_table, cluster_table, real_line.irref_rows, rows)
+    real_line.access_matrix = access_matrix.submatrix(rows)
+    real_line.pruned = minkowski.pruned + len(mcs_table) - len(rows)
+    real_line.pruning = True
+
+
+# Checks a formula string over both flows of time. Returns a dictionary of the real-line model (False if there is
+# none), the Minkowski verdict and the tier that decided the formula, as recorded by the programs
+def check_both(formula_string, pruning=True, precheck=True, ordering='default', parallel=False, processes=None):
+    real_line = real_time.TemporalFormula(formula_string)
+    minkowski = minkowski_spacetime.TemporalFormula(formula_string)
+
+    # The propositional precheck decides both flows of time, the constant valuation one only the real line
+    model = None
+    if precheck:
+        model = real_line.precheck()
+        if model == False:
+            return {'real-line': False, 'minkowski': False, 'tier': real_line.tier}
+
+    # Checks the atom-disjoint components independently, as both programs do. The formula is decided by the costliest
+    # tier that any component checked needed
+    components = real_line.get_components()
+    if len(components) > 1:
+        models = []
+        satisfiable = True
+        tiers = []
+        for component in components:
+            if models is None and not satisfiable:
+                break
+            result = check_both(component.formula, pruning, precheck, ordering, parallel, processes)
+            if models is not None:
+                models = None if result['real-line'] == False else models + [result['real-line']]
+            satisfiable = satisfiable and result['minkowski']
+            tiers.append(result['tier'])
+        model = False if models is None else real_line.combine_models(components, models)
+        return {'real-line': model, 'minkowski': satisfiable, 'tier': max(tiers, key=list(real_time.TIERS).index)}
+
+    share_tables(real_line, minkowski, pruning)
+    # Without pruning, both checks sort the same lists of clusters and irreflexive sets, so they are kept for both
+    # until the checks end
+    if not pruning:
+        real_line.views = minkowski.views = {}
+    try:
+        if model is None:
+            model = real_line.get_model(ordering=ordering, precheck=False)
+        satisfiable = minkowski.check_sat(parallel=parallel, processes=processes, precheck=False)
+    finally:
+        real_line.views = minkowski.views = None
+    return {'real-line': model, 'minkowski': satisfiable, 'tier': 'full'}
+
+
+# Main program
+def main():
+    parser = argparse.ArgumentParser(description="Checks a Priorean temporal formula over the real line and in the "
+                                                 "irreflexive 2-dimensional Minkowski spacetime.")
+    parser.add_argument('--ordering', choices=list(real_time.ORDERINGS), default='default',
+                        help="order in which the real-line search tries the candidates for the next set")
+    parser.add_argument('--parallel', action='store_true',
+                        help="count Minkowski successors and predecessors in worker processes over shared memory")
+    parser.add_argument('--processes', type=int, metavar='N',
+                        help="number of worker processes (default: one per CPU)")
+    parser.add_argument('--no-prune', action='store_true',
+                        help="keep the maximal consistent sets that are unreachable from the formula")
+    parser.add_argument('--no-precheck', action='store_true',
+                        help="skip the quick propositional and constant valuation tests before the full checks")
+    args = parser.parse_args()
+    try:
+        formula_string = input('Enter a temporal formula:')
+        result = check_both(formula_string, pruning=not args.no_prune, precheck=not args.no_precheck,
+                            ordering=args.ordering, parallel=args.parallel, processes=args.processes)
+        print("The formula is formulated correctly.")
+        if result['real-line'] == False:
+            print("No model found over the real line.")
+        else:
+            print(f"A possible model over the real line is {result['real-line']}.")
+        if result['minkowski']:
+            print("The formula is likely to be valid in irreflexive 2-dimensional Minkowski spacetime.")
+        else:
+            print("The formula is invalid in irreflexive 2-dimensional Minkowski spacetime.")
+        print(f"The formula was decided by the {real_time.TIERS[result['tier']]}.")
+
+    except real_time.ParseError:
+        print("Incorrectly formulated temporal formula.")
+    except Exception:
+        print("An error occurred.")
+
+if __name__ == '__main__':
+    start_time = time.time()
+    main()
+    end_time = time.time()
+
+    elapsed_time = end_time - start_time
+    print(f"Elapsed time: {elapsed_time:.6f} seconds")
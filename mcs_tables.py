@@ -0,0 +1,553 @@
+import heapq
+import mmap
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import weakref
+from array import array
+from bisect import bisect_left
+from multiprocessing import shared_memory
+
+# Compact storage shared by real-time.py and minkowski-spacetime.py.
+# A maximal consistent set is determined by which non-negated closure members it contains, so it is stored
+# as an integer bitmask over those members; tables of such sets are kept in flat arrays.
+
+
+# Returns the negation of a formula string, as TemporalFormula.negation does
+def negate(formula_string):
+    if formula_string[0] == '~':
+        return formula_string[1:]
+    else:
+        return '~' + formula_string
+
+
+# Maps the non-negated members of a closure set to bit positions
+class ClosureIndex:
+    __slots__ = ('members', 'bits', 'rules', 'future', 'past')
+
+    def __init__(self, closure_set):
+        self.members = sorted(subformula for subformula in closure_set if not subformula.startswith('~'))
+        self.bits = {subformula: bit for bit, subformula in enumerate(self.members)}
+        self.rules = self.compile_access(closure_set)
+        self.future, self.past = self.compile_eventualities(closure_set)
+
+    def __len__(self):
+        return len(self.members)
+
+    # Returns the bitmask of a maximal consistent set given as a set of strings
+    def encode(self, mcs):
+        mask = 0
+        for subformula in mcs:
+            if subformula in self.bits:
+                mask |= 1 << self.bits[subformula]
+        return mask
+
+    # Returns the set of strings encoded by a bitmask
+    def decode(self, mask):
+        mcs = set()
+        for bit, subformula in enumerate(self.members):
+            if mask >> bit & 1:
+                mcs.add(subformula)
+            else:
+                mcs.add('~' + subformula)
+        return mcs
+
+    # Returns (bit, value) such that the subformula is in a set iff the bit has that value;
+    # None if the subformula can never be in a set (e.g. ~~p, which is not a choice)
+    def literal(self, subformula):
+        if subformula in self.bits:
+            return self.bits[subformula], 1
+        if subformula.startswith('~') and subformula[1:] in self.bits:
+            return self.bits[subformula[1:]], 0
+        return None
+
+    # Compiles TemporalFormula.access into rules (side, literal, side, literal): the first literal holding in its set
+    # forces the second one to hold in the other set; side 0 is m and side 1 is n in m<n
+    def compile_access(self, closure_set):
+        rules = []
+        for subformula in sorted(closure_set):
+            s = self.literal(subformula)
+            if subformula.startswith("F"):
+                rules.append((1, s, 0, s))
+                rules.append((1, self.literal(subformula[1:]), 0, s))
+            elif subformula.startswith("P"):
+                rules.append((0, s, 1, s))
+                rules.append((0, self.literal(subformula[1:]), 1, s))
+            elif subformula.startswith("G"):
+                rules.append((0, s, 1, s))
+                rules.append((0, s, 1, self.literal(subformula[1:])))
+            elif subformula.startswith("H"):
+                rules.append((1, s, 0, s))
+                rules.append((1, s, 0, self.literal(subformula[1:])))
+            elif subformula.startswith("~F"):
+                rules.append((0, s, 1, self.literal(negate(subformula[2:]))))
+                rules.append((0, s, 1, s))
+            elif subformula.startswith("~P"):
+                rules.append((1, s, 0, self.literal(negate(subformula[2:]))))
+                rules.append((1, s, 0, s))
+            elif subformula.startswith("~G"):
+                rules.append((1, s, 0, s))
+                rules.append((1, self.literal(negate(subformula[2:])), 0, s))
+            elif subformula.startswith("~H"):
+                rules.append((0, s, 1, s))
+                rules.append((0, self.literal(negate(subformula[2:])), 1, s))
+        return [rule for rule in rules if rule[1] is not None]
+
+    # Returns the future and past eventualities as (defect, cure) literal pairs: an element has a defect if the defect
+    # literal holds in one of its sets and the cure holds in none, e.g. Fm is a defect with cure m
+    def compile_eventualities(self, closure_set):
+        future = []
+        past = []
+        for subformula in sorted(closure_set):
+            if subformula.startswith("F"):
+                future.append((self.literal(subformula), self.literal(subformula[1:])))
+            elif subformula.startswith("~G"):
+                future.append((self.literal(subformula), self.literal(negate(subformula[2:]))))
+            elif subformula.startswith("P"):
+                past.append((self.literal(subformula), self.literal(subformula[1:])))
+            elif subformula.startswith("~H"):
+                past.append((self.literal(subformula), self.literal(negate(subformula[2:]))))
+        return future, past
+
+    # Returns the cube (care, value) of the sets on the given side of m<n, where the set on the other side is
+    # fixed to mask: a set x is accessible iff x & care == value. Returns None if no set is accessible
+    def cube(self, mask, side):
+        care = 0
+        value = 0
+        for side_a, literal_a, side_b, literal_b in self.rules:
+            if side_a != side:
+                # The fixed set decides whether the rule forces literal_b
+                bit, wanted = literal_a
+                if mask >> bit & 1 != wanted:
+                    continue
+                if literal_b is None:
+                    return None
+                bit, wanted = literal_b
+            else:
+                # literal_a must fail unless literal_b holds in the fixed set
+                if literal_b is not None:
+                    bit, wanted = literal_b
+                    if mask >> bit & 1 == wanted:
+                        continue
+                bit, wanted = literal_a
+                wanted = 1 - wanted
+            if care >> bit & 1:
+                if value >> bit & 1 != wanted:
+                    return None
+            else:
+                care |= 1 << bit
+                value |= wanted << bit
+        return care, value
+
+    # Returns the cube of the sets n with m<n
+    def successor_cube(self, mask):
+        return self.cube(mask, 1)
+
+    # Returns the cube of the sets m with m<n
+    def predecessor_cube(self, mask):
+        return self.cube(mask, 0)
+
+    # Returns the intersection of two cubes
+    @staticmethod
+    def meet(a, b):
+        if a is None or b is None:
+            return None
+        if (a[1] ^ b[1]) & a[0] & b[0]:
+            return None
+        return a[0] | b[0], a[1] | b[1]
+
+    # Returns the cube of the sets n with c<n for every c in a cluster
+    def cluster_successor_cube(self, cluster):
+        cube = (0, 0)
+        for mask in cluster:
+            cube = self.meet(cube, self.successor_cube(mask))
+        return cube
+
+    # Returns the cube of the sets m with m<c for every c in a cluster
+    def cluster_predecessor_cube(self, cluster):
+        cube = (0, 0)
+        for mask in cluster:
+            cube = self.meet(cube, self.predecessor_cube(mask))
+        return cube
+
+    # Checks if m<n for bitmasks m and n
+    def access(self, m, n):
+        cube = self.successor_cube(m)
+        return cube is not None and n & cube[0] == cube[1]
+
+
+# Checks if a literal holds in the set encoded by a bitmask
+def holds(literal, mask):
+    return literal is not None and mask >> literal[0] & 1 == literal[1]
+
+
+# Returns the positions of the set bits of an integer bitset, in increasing order
+def bits_of(bitset):
+    while bitset:
+        low = bitset & -bitset
+        yield low.bit_length() - 1
+        bitset ^= low
+
+
+# Maximal consistent sets stored as rows of bitmasks, in increasing order
+class MCSTable:
+    __slots__ = ('index', 'rows')
+
+    def __init__(self, index, rows=None):
+        if len(index) > 64:
+            raise ValueError("Closure set is too large for explicit enumeration.")
+        self.index = index
+        self.rows = array('Q') if rows is None else rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, row):
+        return self.rows[row]
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def append(self, mask):
+        self.rows.append(mask)
+
+    # Returns the row of a bitmask, or -1 if it is not in the table
+    def find(self, mask):
+        row = bisect_left(self.rows, mask)
+        if row < len(self.rows) and self.rows[row] == mask:
+            return row
+        return -1
+
+    # Returns the rows matching a cube
+    def matching(self, cube):
+        if cube is None:
+            return []
+        care, value = cube
+        return [row for row, mask in enumerate(self.rows) if mask & care == value]
+
+    # Returns the table of the given rows, in increasing order
+    def subtable(self, rows):
+        return MCSTable(self.index, array('Q', (self.rows[row] for row in sorted(rows))))
+
+    # Returns the rows reachable from the given rows via access, forwards (r<n) or backwards (n<r), including
+    # the given rows. As access is transitive, one step reaches everything, and a row already reached needs no step
+    def reachable(self, rows, forward=True):
+        reached = bytearray(len(self.rows))
+        for row in rows:
+            if reached[row]:
+                continue
+            if forward:
+                cube = self.index.successor_cube(self.rows[row])
+            else:
+                cube = self.index.predecessor_cube(self.rows[row])
+            for n in self.matching(cube):
+                reached[n] = 1
+        for row in rows:
+            reached[row] = 1
+        return [row for row in range(len(reached)) if reached[row]]
+
+    # Returns the rows containing a formula string
+    def containing(self, subformula):
+        literal = self.index.literal(subformula)
+        if literal is None:
+            return []
+        bit, value = literal
+        return self.matching((1 << bit, value << bit))
+
+    # Conversion layer: returns the maximal consistent sets as sets of strings
+    def to_sets(self, rows=None):
+        if rows is None:
+            return [self.index.decode(mask) for mask in self.rows]
+        return [self.index.decode(self.rows[row]) for row in rows]
+
+
+# An mcs table kept within a memory ceiling, in bytes of masks. Masks are appended in any order; whenever the
+# buffer outgrows the ceiling it is sorted and spilled to a chunk file in a temporary directory. seal must be called
+# after the last append: it merges the chunks into one sorted file and maps it, so that the rows are a read-only view
+# of the file and every query of MCSTable streams over it, with the operating system paging it in and out. A store
+# that never outgrew its ceiling stays in memory. The directory is removed when the store is garbage collected
+class MCSStore(MCSTable):
+    __slots__ = ('ceiling', 'directory', 'spill_directory', 'chunks', 'remove', '__weakref__')
+
+    # Masks are read and written in blocks of this many
+    BLOCK = 1 << 16
+
+    def __init__(self, index, ceiling, directory=None):
+        super().__init__(index)
+        self.ceiling = ceiling
+        self.directory = directory
+        self.spill_directory = None
+        self.chunks = []
+        self.remove = None
+
+    def append(self, mask):
+        self.rows.append(mask)
+        if 8 * len(self.rows) > self.ceiling:
+            self.spill()
+
+    def extend(self, masks):
+        for mask in masks:
+            self.append(mask)
+
+    # Writes the buffer to a new sorted chunk file
+    def spill(self):
+        if self.spill_directory is None:
+            self.spill_directory = tempfile.mkdtemp(prefix='mcs-store-', dir=self.directory)
+            self.remove = weakref.finalize(self, shutil.rmtree, self.spill_directory, True)
+        path = os.path.join(self.spill_directory, f'chunk-{len(self.chunks)}')
+        with open(path, 'wb') as file:
+            array('Q', sorted(self.rows)).tofile(file)
+        self.chunks.append(path)
+        self.rows = array('Q')
+
+    # Merges the chunks into the sorted rows of the store
+    def seal(self):
+        if self.chunks == []:
+            self.rows = array('Q', sorted(self.rows))
+            return self
+        if len(self.rows) > 0:
+            self.spill()
+        path = os.path.join(self.spill_directory, 'rows')
+        with open(path, 'wb') as file:
+            block = array('Q')
+            for mask in heapq.merge(*(read_masks(chunk, self.BLOCK) for chunk in self.chunks)):
+                block.append(mask)
+                if len(block) == self.BLOCK:
+                    block.tofile(file)
+                    block = array('Q')
+            block.tofile(file)
+        for chunk in self.chunks:
+            os.remove(chunk)
+        self.chunks = []
+        if os.path.getsize(path) > 0:
+            with open(path, 'rb') as file:
+                self.rows = memoryview(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)).cast('Q')
+        return self
+
+    # Returns the store of the given rows, in increasing order, with the same ceiling
+    def subtable(self, rows):
+        store = MCSStore(self.index, self.ceiling, self.directory)
+        for row in sorted(rows):
+            store.append(self.rows[row])
+        return store.seal()
+
+
+# Yields the masks of a chunk file, reading them in blocks
+def read_masks(path, block_size):
+    with open(path, 'rb') as file:
+        while True:
+            block = array('Q')
+            try:
+                block.fromfile(file, block_size)
+            except EOFError:
+                pass
+            if len(block) == 0:
+                return
+            yield from block
+
+
+# Clusters stored as index ranges: cluster k consists of the rows members[bounds[k]:bounds[k+1]] of the mcs table
+class ClusterTable:
+    __slots__ = ('mcs_table', 'members', 'bounds')
+
+    def __init__(self, mcs_table, members=None, bounds=None):
+        self.mcs_table = mcs_table
+        self.members = array('I') if members is None else members
+        self.bounds = array('I', [0]) if bounds is None else bounds
+
+    def __len__(self):
+        return len(self.bounds) - 1
+
+    def __getitem__(self, k):
+        return self.members[self.bounds[k]:self.bounds[k + 1]]
+
+    def append(self, rows):
+        self.members.extend(rows)
+        self.bounds.append(len(self.members))
+
+    # Returns the cluster containing a row, or -1 if the row is irreflexive
+    def cluster_of(self, row):
+        for k in range(len(self)):
+            if row in self[k]:
+                return k
+        return -1
+
+    # Conversion layer: returns the clusters as lists of sets of strings
+    def to_sets(self):
+        return [self.mcs_table.to_sets(self[k]) for k in range(len(self))]
+
+
+# Returns the mcs table, cluster table and irreflexive rows restricted to the given rows, renumbered in increasing
+# order. Every cluster must lie wholly inside or outside the rows, as it does when they are closed under reachability
+def restrict_tables(mcs_table, cluster_table, irref_rows, rows):
+    rows = sorted(rows)
+    renumbered = {row: i for i, row in enumerate(rows)}
+    subtable = mcs_table.subtable(rows)
+    restricted = ClusterTable(subtable)
+    for k in range(len(cluster_table)):
+        if cluster_table[k][0] in renumbered:
+            restricted.append([renumbered[row] for row in cluster_table[k]])
+    return subtable, restricted, array('I', (renumbered[row] for row in irref_rows if row in renumbered))
+
+
+# The access relation between the rows of an mcs table as a bit-packed matrix: bit j of row i is set iff i<j
+class AccessMatrix:
+    __slots__ = ('size', 'width', 'words')
+
+    def __init__(self, size, words=None):
+        self.size = size
+        self.width = (size + 63) // 64
+        self.words = array('Q', bytes(8 * size * self.width)) if words is None else words
+
+    # Computes the matrix of an mcs table from the access cubes
+    @classmethod
+    def build(cls, mcs_table):
+        matrix = cls(len(mcs_table))
+        for i, mask in enumerate(mcs_table):
+            row = 0
+            for j in mcs_table.matching(mcs_table.index.successor_cube(mask)):
+                row |= 1 << j
+            matrix.set_row(i, row)
+        return matrix
+
+    def get(self, i, j):
+        return self.words[i * self.width + (j >> 6)] >> (j & 63) & 1
+
+    # Returns row i as an integer bitset
+    def row(self, i):
+        return int.from_bytes(self.words[i * self.width:(i + 1) * self.width].tobytes(), 'little')
+
+    def set_row(self, i, row):
+        self.words[i * self.width:(i + 1) * self.width] = array('Q', row.to_bytes(8 * self.width, 'little'))
+
+    # Returns the matrix of the relation between the given rows, renumbered in increasing order
+    def submatrix(self, rows):
+        rows = sorted(rows)
+        kept = 0
+        renumbered = {}
+        for i, row in enumerate(rows):
+            kept |= 1 << row
+            renumbered[row] = i
+        matrix = AccessMatrix(len(rows))
+        for i, row in enumerate(rows):
+            packed = 0
+            for column in bits_of(self.row(row) & kept):
+                packed |= 1 << renumbered[column]
+            matrix.set_row(i, packed)
+        return matrix
+
+    # Returns the matrix of the converse relation, whose row j holds the sets i with i<j
+    def transpose(self):
+        columns = [0] * self.size
+        for i in range(self.size):
+            for j in bits_of(self.row(i)):
+                columns[j] |= 1 << i
+        matrix = AccessMatrix(self.size)
+        for j, column in enumerate(columns):
+            matrix.set_row(j, column)
+        return matrix
+
+
+# Binary table files: a header followed by sections aligned to 8 bytes, holding the formula, the closure set
+# (sorted, one member per line), the mcs bitmask rows, the access matrix, the cluster members and bounds
+# and the irreflexive rows. The header also records how many maximal consistent sets pruning removed, as pruned
+# tables cannot serve every use. Integers are little-endian.
+TABLES_MAGIC = b'TLMCS\r\n\x1a'
+TABLES_VERSION = 2
+TABLES_HEADER = struct.Struct('<8sI4xQQQQQQQ')
+
+
+def padded(size):
+    return (size + 7) & ~7
+
+
+# Returns precomputed tables in the binary table format; pruned is the number of sets pruning removed from them
+def pack_tables(formula_string, closure_set, mcs_table, access_matrix, cluster_table, irref_rows, pruned=0):
+    if sys.byteorder != 'little':
+        raise ValueError("Table files can only be written on little-endian machines.")
+    formula_bytes = formula_string.encode('utf-8')
+    closure_bytes = '\n'.join(sorted(closure_set)).encode('utf-8')
+    sections = [formula_bytes, closure_bytes, mcs_table.rows, access_matrix.words,
+                cluster_table.members, cluster_table.bounds, irref_rows]
+    parts = [TABLES_HEADER.pack(TABLES_MAGIC, TABLES_VERSION, len(formula_bytes), len(closure_bytes),
+                                len(mcs_table), len(cluster_table.members), len(cluster_table), len(irref_rows),
+                                pruned)]
+    for section in sections:
+        data = bytes(section)
+        parts.append(data + bytes(padded(len(data)) - len(data)))
+    return b''.join(parts)
+
+
+# Writes precomputed tables to a binary file
+def write_tables(path, formula_string, closure_set, mcs_table, access_matrix, cluster_table, irref_rows, pruned=0):
+    data = pack_tables(formula_string, closure_set, mcs_table, access_matrix, cluster_table, irref_rows, pruned)
+    with open(path, 'wb') as file:
+        file.write(data)
+
+
+# Maps a table file into memory: the arrays of the returned tables are read-only views of the file, so processes
+# loading the same file share its pages. Returns (formula string, closure set, mcs table, access matrix,
+# cluster table, irreflexive rows, number of pruned sets)
+def read_tables(path):
+    with open(path, 'rb') as file:
+        return unpack_tables(memoryview(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)))
+
+
+# Copies precomputed tables into a new shared memory block; the caller closes and unlinks it
+def share_tables(formula_string, closure_set, mcs_table, access_matrix, cluster_table, irref_rows, pruned=0):
+    data = pack_tables(formula_string, closure_set, mcs_table, access_matrix, cluster_table, irref_rows, pruned)
+    block = shared_memory.SharedMemory(create=True, size=len(data))
+    block.buf[:len(data)] = data
+    return block
+
+
+# Attaches to a shared memory block written by share_tables; the arrays of the returned tables are views of the
+# block, which must stay open while they are used. Returns (block, tables) with the tables as in read_tables
+def attach_tables(name):
+    block = shared_memory.SharedMemory(name=name)
+    return block, unpack_tables(block.buf)
+
+
+# Copies the words of an access matrix into a new shared memory block; the caller closes and unlinks it
+def share_matrix(matrix):
+    data = bytes(matrix.words)
+    block = shared_memory.SharedMemory(create=True, size=max(len(data), 1))
+    block.buf[:len(data)] = data
+    return block
+
+
+# Attaches to a shared memory block written by share_matrix. Returns (block, matrix of the given size)
+def attach_matrix(name, size):
+    block = shared_memory.SharedMemory(name=name)
+    matrix = AccessMatrix(size, block.buf[:8 * size * ((size + 63) // 64)].cast('Q'))
+    return block, matrix
+
+
+# Reads tables in the binary table format from a buffer without copying the arrays
+def unpack_tables(view):
+    if sys.byteorder != 'little':
+        raise ValueError("Table files can only be read on little-endian machines.")
+    magic, version, formula_size, closure_size, mcs_count, member_count, cluster_count, irref_count, pruned = \
+        TABLES_HEADER.unpack_from(view)
+    if magic != TABLES_MAGIC:
+        raise ValueError("Not a table file.")
+    if version != TABLES_VERSION:
+        raise ValueError(f"Unsupported table file version {version}.")
+
+    offset = TABLES_HEADER.size
+
+    def section(size, code=None, itemsize=1):
+        nonlocal offset
+        data = view[offset:offset + size * itemsize]
+        offset += padded(size * itemsize)
+        return data if code is None else data.cast(code)
+
+    formula_string = bytes(section(formula_size)).decode('utf-8')
+    closure_set = set(bytes(section(closure_size)).decode('utf-8').split('\n'))
+    mcs_table = MCSTable(ClosureIndex(closure_set), section(mcs_count, 'Q', 8))
+    access_matrix = AccessMatrix(mcs_count, section(mcs_count * ((mcs_count + 63) // 64), 'Q', 8))
+    cluster_table = ClusterTable(mcs_table, section(member_count, 'I', 4), section(cluster_count + 1, 'I', 4))
+    irref_rows = section(irref_count, 'I', 4)
+    return formula_string, closure_set, mcs_table, access_matrix, cluster_table, irref_rows, pruned
@@ -1,4 +1,16 @@
+import argparse
 import time
+from array import array
+from functools import partial
+from multiprocessing import Event, Pool
+
+from cost import admit, estimate_cost, read_calibration
+from mcs_tables import (AccessMatrix, ClosureIndex, ClusterTable, MCSStore, MCSTable, attach_matrix, attach_tables,
+                        bits_of, read_tables, share_matrix, share_tables, write_tables)
+from prechecks import TIERS, propositionally_unsatisfiable
+from simplify import simplify_formula
+from subformula_cache import CACHE, SubformulaCache, closure, consistent_assignments
+from symbolic import SymbolicEngine
 
 class ParseError(Exception):
     '''Raised when a given formula has incorrect formulation.'''
@@ -9,8 +21,24 @@ class TemporalFormula:
         if not isinstance(formula_string, str):
             raise TypeError("Formula must be a string.")
         self.formula = formula_string
-        if not self.parse():
-            raise ParseError("Incorrectly formulated temporal formula.")
+        self.closure_index = None
+        self.mcs_table = None
+        self.cluster_table = None
+        self.irref_rows = None
+        self.access_matrix = None
+        self.pruning = True
+        self.pruned = 0
+        self.views = None
+        self.row_bitsets = None
+        self.memory_ceiling = None
+        self.tier = None
+        # The parse of a formula string is shared by all its instances through the subformula cache
+        self.subformulas = CACHE.get(('parse', formula_string))
+        if self.subformulas is None:
+            if not self.parse():
+                raise ParseError("Incorrectly formulated temporal formula.")
+            self.subformulas = tuple(self.subformulas)
+            CACHE.put(('parse', formula_string), self.subformulas, 1 + len(self.subformulas))
     def __str__(self):
         return self.formula
 
@@ -47,44 +75,21 @@ class TemporalFormula:
     # Returns left subformula as a TemporalFormula object
     def left_subformula(self):
         if self.formula[0] == '(':
-            left_bracket_counter = 1
-            for i in range(1, len(self.formula)):
-                if self.formula[i] == '(':
-                    left_bracket_counter += 1
-                elif self.formula[i] == ')':
-                    left_bracket_counter -= 1
-                elif self.connective(i) and left_bracket_counter == 1:
-                    formula_no_bracket = self.formula[1:-1]
-                    return TemporalFormula(formula_no_bracket[:i - 1])
+            return TemporalFormula(self.formula[1:self.subformulas[-1][2]])
         else:
             return self
 
     # Returns right subformula as a TemporalFormula object
     def right_subformula(self):
         if self.formula[0] == '(':
-            left_bracket_counter = 1
-            for i in range(1, len(self.formula)):
-                if self.formula[i] == '(':
-                    left_bracket_counter += 1
-                elif self.formula[i] == ')':
-                    left_bracket_counter -= 1
-                elif self.connective(i) and left_bracket_counter == 1:
-                    formula_no_bracket = self.formula[1:-1]
-                    return TemporalFormula(formula_no_bracket[i:])
+            return TemporalFormula(self.formula[self.subformulas[-1][2] + 1:-1])
         else:
             return self
 
     # Returns connective that is within 1 bracket access
     def conjunction(self):
         if self.formula[0] == '(':
-            left_bracket_counter = 1
-            for i in range(1, len(self.formula)):
-                if self.formula[i] == '(':
-                    left_bracket_counter += 1
-                elif self.formula[i] == ')':
-                    left_bracket_counter -= 1
-                elif self.connective(i) and left_bracket_counter == 1:
-                    return self.formula[i]
+            return self.formula[self.subformulas[-1][2]]
 
     # Expands ~(.) type formulas into (.)
     def expand(self):
@@ -102,164 +107,263 @@ class TemporalFormula:
         else:
             return self
 
-    # Checks whether the specified formula is correctly formulated
+    # Checks whether the specified formula is correctly formulated. The formula is read once from left to right with
+    # an explicit stack of the subformulas still open, so deeply nested formulas do not recurse. Every subformula is
+    # recorded as (start, end, connective): its index range and the index of its connective, -1 if it has none.
+    # Subformulas are recorded before the formulas containing them; the whole formula comes last
     def parse(self):
-        if len(self.formula) == 0:
-            return False
-        elif not self.prop(0) and not self.operator(0) and self.formula[0]!='(':
-            return False
-        elif self.prop(0):
-            if len(self.formula) == 1:
-                return True
-            else:
+        formula = self.formula
+        subformulas = []
+        stack = []
+        position = 0
+        while True:
+            if position == len(formula):
                 return False
-        elif self.operator(0):
-            formula_no_operator = TemporalFormula(self.formula[1:])
-            return formula_no_operator.parse()
-        elif self.formula[0] == '(':
-            if self.formula[-1]!=')':
+            if self.operator(position) or formula[position] == '(':
+                stack.append([position, -1])
+                position += 1
+                continue
+            if not self.prop(position):
                 return False
+            end = position + 1
+            subformulas.append((position, end, -1))
+
+            # Closes the open subformulas that end here
+            while stack:
+                start, connective = stack[-1]
+                if formula[start] != '(':
+                    subformulas.append((start, end, -1))
+                elif connective == -1:
+                    if end == len(formula) or not self.connective(end):
+                        return False
+                    stack[-1][1] = end
+                    break
+                else:
+                    if end == len(formula) or formula[end] != ')':
+                        return False
+                    end += 1
+                    subformulas.append((start, end, connective))
+                stack.pop()
+
+            if not stack:
+                if end != len(formula):
+                    return False
+                self.subformulas = subformulas
+                return True
+            position = stack[-1][1] + 1
+
+    # Returns an equivalent formula with a smaller closure, rewritten under the equivalences of this flow of time
+    def simplify(self):
+        return TemporalFormula(simplify_formula(self, 'minkowski'))
+
+    # Returns the estimated cost of checking the formula with each engine, as cost.estimate_cost, from its closure
+    # alone
+    def estimate_cost(self, calibration=None):
+        return estimate_cost(self, 'minkowski', calibration)
+
+    # Returns the set of atomic propositions occurring in the formula
+    def get_atoms(self):
+        return {char for char in self.formula if char.isalpha() and char.islower()}
+
+    # Splits the formula along its top-level conjunctions: returns the conjuncts and the conjunctions joining them
+    def get_conjuncts(self):
+        connectives = {(start, end): connective for start, end, connective in self.subformulas}
+        conjuncts = []
+        conjunctions = []
+        stack = [(0, len(self.formula))]
+        while stack:
+            start, end = stack.pop()
+            connective = connectives[(start, end)]
+            if connective != -1 and self.formula[connective] == '&':
+                conjunctions.append(self.formula[start:end])
+                stack.append((connective + 1, end - 1))
+                stack.append((start + 1, connective))
             else:
-                left_bracket_counter = 1
-                for i in range(1, len(self.formula)):
-                    if self.formula[i] == '(':
-                        left_bracket_counter += 1
-                    elif self.formula[i] == ')':
-                        left_bracket_counter -= 1
-                    elif self.connective(i) and left_bracket_counter == 1:
-                        formula_no_bracket = self.formula[1:-1]
-                        list_of_subformulas = [TemporalFormula(formula_no_bracket[:i - 1]),
-                                               TemporalFormula(formula_no_bracket[i:])]
-                        return all(subformula.parse() for subformula in list_of_subformulas)
+                conjuncts.append(TemporalFormula(self.formula[start:end]))
+        return conjuncts, conjunctions
+
+    # Groups the top-level conjuncts into components that share no atoms: returns one conjunction per component
+    def get_components(self):
+        conjuncts, conjunctions = self.get_conjuncts()
+        if len(conjuncts) == 1:
+            return [self]
+
+        # Union-find over the atoms, so that conjuncts sharing an atom end up in the same component
+        parent = {}
+
+        def find(atom):
+            while parent.setdefault(atom, atom) != atom:
+                parent[atom] = parent[parent[atom]]
+                atom = parent[atom]
+            return atom
+
+        for conjunct in conjuncts:
+            atoms = sorted(conjunct.get_atoms())
+            for atom in atoms[1:]:
+                parent[find(atom)] = find(atoms[0])
+
+        groups = {}
+        for conjunct in conjuncts:
+            root = find(min(conjunct.get_atoms()))
+            if conjunct.formula not in groups.setdefault(root, []):
+                groups[root].append(conjunct.formula)
+
+        components = []
+        for group in groups.values():
+            formula_string = group[-1]
+            for conjunct in reversed(group[:-1]):
+                formula_string = '(' + conjunct + '&' + formula_string + ')'
+            component = TemporalFormula(formula_string)
+            component.pruning = self.pruning
+            component.memory_ceiling = self.memory_ceiling
+            components.append(component)
+        return components
 
     # Returns the closure set of the specified formula
     def get_closure_set(self):
+        return set(closure(self))
 
-        closure_set = set()
-
-        if len(self.formula) == 1:
-            new_items = {self.formula, self.negation().formula}
-            closure_set.update(new_items)
-
-            return closure_set
-
-        elif self.operator(0):
-            operator_subformula = TemporalFormula(self.formula[1:])
-            new_items = {self.formula, self.negation().formula}
-            closure_set.update(new_items)
-            closure_set.update(operator_subformula.get_closure_set())
-
-            return closure_set
-
-        elif self.formula[0] == '(':
-
-            bracket_counter = 1
-
-            for i in range(1, len(self.formula)):
-                if self.formula[i] == '(':
-                    bracket_counter += 1
-                elif self.formula[i] == ')':
-                    bracket_counter -= 1
-                elif self.connective(i) and bracket_counter == 1:
-                    inner_formula = self.formula[1:-1]
-                    left_subformula = TemporalFormula(inner_formula[:i - 1])
-                    right_subformula = TemporalFormula(inner_formula[i:])
-                    new_items = {self.formula, self.negation().formula}
-                    closure_set.update(new_items)
-                    closure_set.update(left_subformula.get_closure_set())
-                    closure_set.update(right_subformula.get_closure_set())
-
-                    return closure_set
-
+    # Returns the bit index of the non-negated members of the closure set, used by the compact tables
+    def get_closure_index(self):
+        if self.closure_index is None:
+            self.closure_index = ClosureIndex(self.get_closure_set())
+        return self.closure_index
 
     # Returns a list of choice sets of the specified formula
     def get_choice_set(self):
-        subformulas = []
-        list_of_choice_sets = []
-
-        for subformula in self.get_closure_set():
-            if not subformula[0] == '~':
-                subformulas.append(subformula)
-
-        for i in range(2 ** len(subformulas)):
-            choice_set = set()
-
-            combo = bin(i)[2:].zfill(len(subformulas))
-
-            for j in range(len(subformulas)):
-                temp = TemporalFormula(subformulas[j])
-                if combo[j] == '1':
-                    choice_set.add(temp.formula)
-                else:
-                    choice_set.add(temp.negation().formula)
-
-            list_of_choice_sets.append(choice_set)
-
-        return list_of_choice_sets
-
-    # Returns a list of maximal propositionally consistent sets from the list of a choice set for a given formula
-    def get_mc_set(self):
-
-        # Checks that a set is propositionally consistent
-        def is_consistent(choice_set):
-            temp_set = set()
-            for subformula in choice_set:
-                temp_set.add(TemporalFormula(subformula).expand())
-            for formula in temp_set:
-                if "~HF"+formula.formula in choice_set:
+        index = self.get_closure_index()
+        return [index.decode(mask) for mask in range(2 ** len(index))]
+
+    # Checks that a set is propositionally consistent
+    def is_consistent(self, choice_set):
+        temp_set = set()
+        for subformula in choice_set:
+            temp_set.add(TemporalFormula(subformula).expand())
+        for formula in temp_set:
+            if "~HF"+formula.formula in choice_set:
+                return False
+            if "~GP"+formula.formula in choice_set:
+                return False
+            if formula.formula.startswith("F"):
+                if "G~"+formula.formula[1:] in choice_set:
                     return False
-                if "~GP"+formula.formula in choice_set:
+            if formula.formula.startswith("P"):
+                if "H~"+formula.formula[1:] in choice_set:
                     return False
-                if formula.formula.startswith("F"):
-                    if "G~"+formula.formula[1:] in choice_set:
-                        return False
-                if formula.formula.startswith("P"):
-                    if "H~"+formula.formula[1:] in choice_set:
-                        return False
-                if formula.formula.startswith("G"):
-                    if "F~"+formula.formula[1:] in choice_set:
-                        return False
-                if formula.formula.startswith("H"):
-                    if "P~"+formula.formula[1:] in choice_set:
-                        return False
-                if formula.formula.startswith("~F"):
-                    if "~G~"+formula.formula[2:] in choice_set:
-                        return False
-                if formula.formula.startswith("~P"):
-                    if "~H~"+formula.formula[2:] in choice_set:
-                        return False
-                if formula.formula.startswith("~G"):
-                    if "~F~"+formula.formula[2:] in choice_set:
-                        return False
-                if formula.formula.startswith("~H"):
-                    if "~P~"+formula.formula[2:] in choice_set:
-                        return False
-                if formula.conjunction() == "|":
-                    if formula.left_subformula().formula not in choice_set:
-                        if formula.right_subformula().formula not in choice_set:
-                            return False
-                if formula.conjunction() == "&":
-                    if formula.left_subformula().formula not in choice_set:
+            if formula.formula.startswith("G"):
+                if "F~"+formula.formula[1:] in choice_set:
+                    return False
+            if formula.formula.startswith("H"):
+                if "P~"+formula.formula[1:] in choice_set:
+                    return False
+            if formula.formula.startswith("~F"):
+                if "~G~"+formula.formula[2:] in choice_set:
+                    return False
+            if formula.formula.startswith("~P"):
+                if "~H~"+formula.formula[2:] in choice_set:
+                    return False
+            if formula.formula.startswith("~G"):
+                if "~F~"+formula.formula[2:] in choice_set:
+                    return False
+            if formula.formula.startswith("~H"):
+                if "~P~"+formula.formula[2:] in choice_set:
+                    return False
+            if formula.conjunction() == "|":
+                if formula.left_subformula().formula not in choice_set:
+                    if formula.right_subformula().formula not in choice_set:
                         return False
+            if formula.conjunction() == "&":
+                if formula.left_subformula().formula not in choice_set:
+                    return False
+                if formula.right_subformula().formula not in choice_set:
+                    return False
+            if formula.conjunction() == ">":
+                if formula.left_subformula().formula in choice_set:
                     if formula.right_subformula().formula not in choice_set:
                         return False
-                if formula.conjunction() == ">":
-                    if formula.left_subformula().formula in choice_set:
-                        if formula.right_subformula().formula not in choice_set:
-                            return False
-            return True
-
-        list_of_mc_sets = []
+        return True
 
-        for choice_set in self.get_choice_set():
-            if is_consistent(choice_set):
-                # if density(choice_set):
-                list_of_mc_sets.append(choice_set)
+    # Returns the table of maximal consistent sets. The consistent choice sets are joined from those of the
+    # subformulas, which are shared with other formulas through the subformula cache
+    def get_mcs_table(self):
+        if self.mcs_table is None:
+            index = self.get_closure_index()
+            if self.memory_ceiling is None:
+                members, masks = consistent_assignments(self)
+                mcs_table = MCSTable(index, array('Q', masks))
+            else:
+                mcs_table = MCSStore(index, self.memory_ceiling)
+                consistent_assignments(self, output=mcs_table)
+                mcs_table.seal()
+            if self.pruning:
+                mcs_table = self.prune(mcs_table)
+            self.mcs_table = mcs_table
+        return self.mcs_table
+
+    # Keeps only the maximal consistent sets that check_sat can look at: those reachable forwards from one containing
+    # the formula, and those before them, which are needed to count predecessors
+    def prune(self, mcs_table):
+        sources = mcs_table.containing(self.formula)
+        rows = mcs_table.reachable(mcs_table.reachable(sources, True), False)
+        self.pruned = len(mcs_table) - len(rows)
+        return mcs_table.subtable(rows)
 
-        return list_of_mc_sets
+    # Returns a list of maximal propositionally consistent sets from the list of a choice set for a given formula
+    def get_mc_set(self):
+        mcs_table = self.get_mcs_table()
+        return self.view('mc_set', mcs_table, mcs_table.to_sets)
+
+    # Returns a list of sets of strings computed by convert from a table. While a check keeps views, the list is
+    # computed once per table, as the check asks for the same lists over and over, and a copy of it is returned;
+    # otherwise it is computed on every call, so that only the tables stay in memory between checks
+    def view(self, name, table, convert):
+        if self.views is None:
+            return convert()
+        if name not in self.views or self.views[name][0] is not table:
+            self.views[name] = (table, convert())
+        return list(self.views[name][1])
+
+    # Runs a check with the lists computed by view kept until it returns, unless a caller keeps them already
+    def keeping_views(self, check, *args):
+        if self.views is not None:
+            return check(*args)
+        self.views = {}
+        try:
+            return check(*args)
+        finally:
+            self.views = None
+
+    # Returns the access relation between the rows of the mcs table as a bit-packed matrix
+    def get_access_matrix(self):
+        if self.access_matrix is None:
+            self.access_matrix = AccessMatrix.build(self.get_mcs_table())
+        return self.access_matrix
+
+    # Writes the closure set, maximal consistent sets, access matrix, clusters and irreflexive sets to a binary file
+    def export_tables(self, path):
+        write_tables(path, self.formula, self.get_closure_set(), self.get_mcs_table(), self.get_access_matrix(),
+                     self.get_cluster_table(), self.irref_rows, self.pruned)
+
+    # Maps the tables of this formula from a binary file written by export_tables, without copying them
+    def import_tables(self, path):
+        formula_string, closure_set, mcs_table, access_matrix, cluster_table, irref_rows, pruned = read_tables(path)
+        if formula_string != self.formula or closure_set != self.get_closure_set():
+            raise ValueError("The tables were computed for a different formula.")
+        self.closure_index = mcs_table.index
+        self.mcs_table = mcs_table
+        self.access_matrix = access_matrix
+        self.cluster_table = cluster_table
+        self.irref_rows = irref_rows
+        self.pruned = pruned
 
     # Checks if a set m can access a set n i.e. m<n
     def access(self, m, n):
+        # The matrix only covers the sets in the table; any other set, e.g. a pruned one, is compared by its members
+        if self.access_matrix is not None:
+            index = self.closure_index
+            row, column = self.mcs_table.find(index.encode(m)), self.mcs_table.find(index.encode(n))
+            if row >= 0 and column >= 0:
+                return self.access_matrix.get(row, column) == 1
         for subformula in self.get_closure_set():
             if subformula.startswith("F"):
                 if subformula in n:
@@ -322,53 +426,57 @@ class TemporalFormula:
         else:
             return False
 
+    # Computes the cluster table and the rows of the irreflexive maximal consistent sets
+    def get_cluster_table(self):
+        if self.cluster_table is None:
+            mcs_table = self.get_mcs_table()
+            index = mcs_table.index
+            cluster_table = ClusterTable(mcs_table)
+            irref_rows = array('I')
+            clustered = bytearray(len(mcs_table))
+            for row, mask in enumerate(mcs_table):
+                if clustered[row]:
+                    continue
+                if not index.access(mask, mask):
+                    irref_rows.append(row)
+                    continue
+                # The cluster [m] consists of the sets n with m<n and n<m
+                successors = index.successor_cube(mask)
+                predecessors = index.predecessor_cube(mask)
+                cluster = []
+                for n in mcs_table.matching(successors):
+                    if mcs_table[n] & predecessors[0] == predecessors[1]:
+                        cluster.append(n)
+                        clustered[n] = 1
+                cluster_table.append(cluster)
+            self.cluster_table = cluster_table
+            self.irref_rows = irref_rows
+        return self.cluster_table
+
     # Returns a list of all clusters for a given temporal formula
     def list_of_clusters(self):
 
-        # Given a reflexive mcs, returns the corresponding cluster [m]
-        def get_cluster(m):
-            if self.is_reflexive(m):
-                cluster = [m]
-                for n in self.get_mc_set():
-                    if self.access(m, n) and self.access(n, m):
-                        if n not in cluster:
-                            cluster.append(n)
-                return cluster
-            else:
-                return None
-
-        list_of_clusters = []
-
-        for mcs in self.get_mc_set():
-            if self.is_reflexive(mcs):
-                cluster = get_cluster(mcs)
-                cluster_list = sorted([list(subset) for subset in cluster])
-                if cluster_list not in list_of_clusters:
-                    list_of_clusters.append(cluster_list)
-
-        converted_clusters = []
-
-        for cluster in list_of_clusters:
-            converted_cluster = []
-            for subset in cluster:
-                converted_cluster.append(set(subset))
-            converted_clusters.append(converted_cluster)
+        def sort_clusters():
+            converted_clusters = self.get_cluster_table().to_sets()
+            sorted_clusters = sorted(converted_clusters,
+                                     key=lambda cluster:[self.precedes(cluster, other)
+                                                         for other in converted_clusters], reverse=True)
+            return sorted_clusters
 
-        sorted_clusters = sorted(converted_clusters,
-                                 key=lambda cluster:[self.precedes(cluster, other)
-                                                     for other in converted_clusters], reverse=True)
-        return sorted_clusters
+        return self.view('clusters', self.get_cluster_table(), sort_clusters)
 
     # Returns a list of irreflexive maximal consistent sets
     def list_of_irref_mcs(self):
-        list_of_irref_mcs = []
-        for mcs in self.get_mc_set():
-            if not self.is_reflexive(mcs):
-                list_of_irref_mcs.append(mcs)
-        sorted_irref_mcs = sorted(list_of_irref_mcs,
-                                 key=lambda mcs: [self.access(mcs, other) for other in list_of_irref_mcs],
-                                 reverse=True)
-        return sorted_irref_mcs
+
+        def sort_irref_mcs():
+            list_of_irref_mcs = self.mcs_table.to_sets(self.irref_rows)
+            sorted_irref_mcs = sorted(list_of_irref_mcs,
+                                     key=lambda mcs: [self.access(mcs, other) for other in list_of_irref_mcs],
+                                     reverse=True)
+            return sorted_irref_mcs
+
+        self.get_cluster_table()
+        return self.view('irref_mcs', self.irref_rows, sort_irref_mcs)
 
     # Checks if c<d, where c,d are clusters
     def precedes(self, c, d):
@@ -454,7 +562,124 @@ class TemporalFormula:
                 list_of_successors.append(d)
         return list_of_successors
 
-    def check_sat(self):
+    # Returns the irreflexive sets whose cluster successors and predecessors check_sat counts, and those whose
+    # successors it counts, as bitsets of rows; up gives the bitset of the sets after a row
+    def get_counted_rows(self, up):
+        mcs_table = self.get_mcs_table()
+        self.get_cluster_table()
+        irref = 0
+        for row in self.irref_rows:
+            irref |= 1 << row
+        # The sets after one containing the formula, and the sets after those
+        after = 0
+        for row in mcs_table.containing(self.formula):
+            after |= up(row)
+        later = 0
+        for row in bits_of(after):
+            later |= up(row)
+        return after & irref, later & irref
+
+    # Returns the tasks of the count check: (row, irref_counted, successors_counted) for every counted row
+    def get_count_tasks(self, up):
+        irref_counted, successors_counted = self.get_counted_rows(up)
+        return [(row, bool(irref_counted >> row & 1), bool(successors_counted >> row & 1))
+                for row in bits_of(irref_counted | successors_counted)]
+
+    # Checks the successor and predecessor counts of check_sat in worker processes. The tables and the transposed
+    # access matrix are placed in shared memory; the first violation found stops every worker
+    def check_counts_in_parallel(self, processes=None):
+        tasks = self.get_count_tasks(self.get_access_matrix().row)
+        if tasks == []:
+            return True
+        tables = share_tables(self.formula, self.get_closure_set(), self.get_mcs_table(), self.get_access_matrix(),
+                              self.get_cluster_table(), self.irref_rows, self.pruned)
+        transpose = share_matrix(self.get_access_matrix().transpose())
+        violation = Event()
+        try:
+            with Pool(processes, initializer=attach_counter,
+                      initargs=(tables.name, transpose.name, len(self.get_mcs_table()), violation)) as pool:
+                for satisfied in pool.imap_unordered(check_counts, tasks):
+                    if not satisfied:
+                        violation.set()
+                        return False
+        finally:
+            tables.close()
+            tables.unlink()
+            transpose.close()
+            transpose.unlink()
+        return True
+
+    # Returns the sets after a row (or before it) as a bitset, from the rows matching its access cube, so that no
+    # access matrix is built; the bitsets are kept in a least recently used cache within the memory ceiling
+    def streamed_row(self, row, forward):
+        key = (row, forward)
+        bitset = self.row_bitsets.get(key)
+        if bitset is None:
+            mcs_table = self.get_mcs_table()
+            index = mcs_table.index
+            cube = index.successor_cube(mcs_table[row]) if forward else index.predecessor_cube(mcs_table[row])
+            packed = bytearray((len(mcs_table) + 7) // 8)
+            for n in mcs_table.matching(cube):
+                packed[n >> 3] |= 1 << (n & 7)
+            bitset = int.from_bytes(packed, 'little')
+            self.row_bitsets.put(key, bitset, 1 + len(packed))
+        return bitset
+
+    # Checks the successor and predecessor counts of check_sat as check_counts_in_parallel does, serially and over
+    # bitsets read off the mcs table, for tables under a memory ceiling
+    def check_counts_streamed(self):
+        self.row_bitsets = SubformulaCache(self.memory_ceiling)
+        try:
+            up = partial(self.streamed_row, forward=True)
+            down = partial(self.streamed_row, forward=False)
+            counter = SuccessorCounter(self.get_cluster_table(), self.irref_rows, up, down)
+            return all(counter.check(*task) for task in self.get_count_tasks(up))
+        finally:
+            self.row_bitsets = None
+
+    # Decides the formula with the propositional test of prechecks.py: returns False if it is propositionally
+    # unsatisfiable and None otherwise. The check below rejects some formulas that a constant valuation satisfies,
+    # so the constant valuation test is not run
+    def precheck(self):
+        if propositionally_unsatisfiable(self):
+            self.tier = 'propositional'
+            return False
+        return None
+
+    def check_sat(self, parallel=False, engine='explicit', processes=None, precheck=True):
+        return self.keeping_views(self.decide_sat, parallel, engine, processes, precheck)
+
+    # Checks the satisfiability as check_sat, with the lists of sets of strings kept
+    def decide_sat(self, parallel, engine, processes, precheck):
+
+        # Decides easy formulas without enumerating the maximal consistent sets; self.tier records what decided it
+        if precheck:
+            satisfiable = self.precheck()
+            if satisfiable is not None:
+                return satisfiable
+        self.tier = 'full'
+
+        # Checks the atom-disjoint components independently; the formula is satisfiable iff every component is
+        components = self.get_components()
+        if len(components) > 1:
+            if parallel:
+                with Pool(processes) as pool:
+                    return all(pool.imap(partial(component_sat, engine=engine, precheck=precheck, pruning=self.pruning,
+                                                 memory_ceiling=self.memory_ceiling),
+                                         [component.formula for component in components]))
+            return all(component.check_sat(engine=engine, precheck=precheck) for component in components)
+
+        if engine == 'bdd':
+            return SymbolicEngine(self).check_sat()
+
+        # Under a memory ceiling, the counts are checked over rows, as neither the lists of sets of strings nor the
+        # access matrix are built
+        if parallel or self.memory_ceiling is not None:
+            if self.get_mcs_table().containing(self.formula) == []:
+                return False
+            if self.memory_ceiling is not None:
+                return self.check_counts_streamed()
+            return self.check_counts_in_parallel(processes)
 
         # Checks formula is in at least one mcs
         for s in self.get_mc_set():
@@ -487,32 +712,204 @@ class TemporalFormula:
                             return False
         return True
 
+# Counts successors and predecessors with a bitset form of TemporalFormula.successor, given the bitsets of the sets
+# after a row (up) and before it (down), read from access matrices in shared memory or off the mcs table. An element
+# is a cluster or an irreflexive set, given as (members, sets after it, sets before it); as access is transitive, a
+# cluster is before and after the same sets as any of its members. A violation event set elsewhere stops the counts
+class SuccessorCounter:
+
+    def __init__(self, cluster_table, irref_rows, up, down, violation=None):
+        self.up = up
+        self.down = down
+        self.violation = violation
+        self.irref = 0
+        for row in irref_rows:
+            self.irref |= 1 << row
+        self.clusters = []
+        for k in range(len(cluster_table)):
+            members = cluster_table[k]
+            bitset = 0
+            for row in members:
+                bitset |= 1 << row
+            self.clusters.append((members[0], bitset))
+
+    def element(self, row):
+        return 1 << row, self.up(row), self.down(row)
+
+    def cluster(self, representative, members):
+        return members, self.up(representative), self.down(representative)
+
+    def stopped(self):
+        return self.violation is not None and self.violation.is_set()
+
+    # Checks if m is a successor of c: c<m, and every z with c<z<m outside c and m has z<c and m<z
+    @staticmethod
+    def successor(c, m):
+        members_c, up_c, down_c = c
+        members_m, up_m, down_m = m
+        if members_m & ~up_c:
+            return False
+        between = up_c & down_m & ~(members_c | members_m)
+        return between & ~(down_c & up_m) == 0
+
+    # Counts the clusters that are successors (or predecessors) of an element, up to a limit
+    def count_clusters(self, element, forward, limit=3):
+        count = 0
+        for representative, members in self.clusters:
+            if self.stopped():
+                break
+            if forward:
+                if element[1] >> representative & 1 and self.successor(element, self.cluster(representative, members)):
+                    count += 1
+            elif element[2] >> representative & 1 and self.successor(self.cluster(representative, members), element):
+                count += 1
+            if count == limit:
+                break
+        return count
+
+    # Counts the irreflexive sets that are successors of an element, up to a limit
+    def count_irref_successors(self, element, limit=3):
+        count = 0
+        for row in bits_of(element[1] & self.irref):
+            if self.stopped():
+                break
+            if self.successor(element, self.element(row)):
+                count += 1
+                if count == limit:
+                    break
+        return count
+
+    # Checks the counts of check_sat for an irreflexive set; returns False on a violation
+    def check(self, row, irref_counted, successors_counted):
+        element = self.element(row)
+        if irref_counted:
+            if self.count_clusters(element, True) not in {1, 2}:
+                return False
+            if self.count_clusters(element, False) not in {1, 2}:
+                return False
+        if successors_counted:
+            cluster_successors = self.count_clusters(element, True)
+            if cluster_successors != 0 and cluster_successors + self.count_irref_successors(element) > 2:
+                return False
+        return True
+
+# The successor counter of a worker process of check_counts_in_parallel, and the shared memory blocks it reads
+successor_counter = None
+shared_blocks = None
+
+# Initialises a worker process of check_counts_in_parallel
+def attach_counter(tables_name, transpose_name, size, violation):
+    global successor_counter, shared_blocks
+    tables_block, tables = attach_tables(tables_name)
+    transpose_block, down = attach_matrix(transpose_name, size)
+    formula_string, closure_set, mcs_table, up, cluster_table, irref_rows, pruned = tables
+    shared_blocks = (tables_block, transpose_block)
+    successor_counter = SuccessorCounter(cluster_table, irref_rows, up.row, down.row, violation)
+
+# Checks the counts for one irreflexive set in a worker process
+def check_counts(task):
+    return successor_counter.check(*task)
+
+# Checks the satisfiability of a single component under the options of the formula it was split from; used by the
+# worker processes of check_sat
+def component_sat(formula_string, engine='explicit', precheck=True, pruning=True, memory_ceiling=None):
+    component = TemporalFormula(formula_string)
+    component.pruning = pruning
+    component.memory_ceiling = memory_ceiling
+    return component.check_sat(engine=engine, precheck=precheck)
+
 # Main program
 def main():
+    parser = argparse.ArgumentParser(description="Checks a Priorean temporal formula in the irreflexive "
+                                                 "2-dimensional Minkowski spacetime.")
+    parser.add_argument('--engine', choices=['explicit', 'bdd'], default='explicit',
+                        help="explicit enumerates every maximal consistent set; "
+                             "bdd represents the sets and the access relation symbolically")
+    parser.add_argument('--parallel', action='store_true',
+                        help="count successors and predecessors in worker processes over shared memory")
+    parser.add_argument('--processes', type=int, metavar='N',
+                        help="number of worker processes (default: one per CPU)")
+    parser.add_argument('--simplify', action='store_true',
+                        help="rewrite the formula into an equivalent one with a smaller closure first")
+    parser.add_argument('--no-prune', action='store_true',
+                        help="keep the maximal consistent sets that are unreachable from the formula")
+    parser.add_argument('--memory-ceiling', type=float, metavar='MB',
+                        help="keep at most MB megabytes of maximal consistent sets in memory, spilling the rest to "
+                             "sorted files in the temporary directory")
+    parser.add_argument('--estimate', action='store_true',
+                        help="print the estimated cost of checking the formula and its admission decision instead")
+    parser.add_argument('--calibration', metavar='FILE',
+                        help="estimate costs with the calibration in FILE, written by cost.py")
+    parser.add_argument('--no-precheck', action='store_true',
+                        help="skip the quick propositional test before the full check")
+    parser.add_argument('--load-tables', metavar='FILE',
+                        help="map the precomputed tables of the formula from FILE instead of computing them")
+    parser.add_argument('--save-tables', metavar='FILE',
+                        help="write the precomputed tables of the formula to FILE")
+    args = parser.parse_args()
     try:
         formula = TemporalFormula(input('Enter a temporal formula:'))
         print("The formula is formulated correctly.")
+        original = formula
+        if args.simplify:
+            formula = formula.simplify()
+            print(f"The formula simplifies to {formula.formula}; the closure shrank from "
+                  f"{len(original.get_closure_set())} to {len(formula.get_closure_set())} formulas.")
+        if args.estimate:
+            estimate = formula.estimate_cost(read_calibration(args.calibration) if args.calibration else None)
+            print(f"The closure has {estimate['closure_size']} formulas, {estimate['members']} of them "
+                  f"non-negated, and the formula has {estimate['temporal_operators']} temporal operators: "
+                  f"{estimate['choice_sets']} choice sets and at most {estimate['mcs_bound']} maximal consistent "
+                  f"sets.")
+            for engine in estimate['runtime']:
+                print(f"The {engine} engine should take {estimate['runtime'][engine]:.3g} seconds and "
+                      f"{estimate['memory'][engine] / 2 ** 20:.3g} MiB.")
+            print(f"The admission decision for the {args.engine} engine is {admit(estimate, args.engine)}.")
+            return
+        formula.pruning = not args.no_prune
+        if args.memory_ceiling is not None:
+            formula.memory_ceiling = int(args.memory_ceiling * 2 ** 20)
+        if args.load_tables:
+            formula.import_tables(args.load_tables)
+        if args.save_tables:
+            formula.export_tables(args.save_tables)
         print(f"The closure set is {formula.get_closure_set()}.")
-        print(f"The choice sets are {formula.get_choice_set()}.")
-        print(f"The maximal consistent sets are {formula.get_mc_set()}.")
-        print(f"The clusters are {formula.list_of_clusters()}.")
-        print(f"The irreflexive maximal consistent sets are {formula.list_of_irref_mcs()}.")
-
-        if formula.check_sat():
+        satisfiable = None if args.no_precheck else formula.precheck()
+        if satisfiable is None and args.engine == 'explicit':
+            # Under a memory ceiling, only the sizes of the tables are printed
+            if formula.memory_ceiling is None:
+                print(f"The choice sets are {formula.get_choice_set()}.")
+                print(f"The maximal consistent sets are {formula.get_mc_set()}.")
+            else:
+                print(f"There are {len(formula.get_mcs_table())} maximal consistent sets.")
+            if formula.pruned:
+                print(f"{formula.pruned} maximal consistent sets unreachable from the formula were pruned.")
+            if formula.memory_ceiling is None:
+                print(f"The clusters are {formula.list_of_clusters()}.")
+                print(f"The irreflexive maximal consistent sets are {formula.list_of_irref_mcs()}.")
+            else:
+                print(f"There are {len(formula.get_cluster_table())} clusters and {len(formula.irref_rows)} "
+                      f"irreflexive maximal consistent sets.")
+        if satisfiable is None:
+            satisfiable = formula.check_sat(parallel=args.parallel, engine=args.engine, processes=args.processes,
+                                            precheck=False)
+        if satisfiable:
             print(f"The formula is likely to be valid in irreflexive 2-dimensional Minkowski spacetime.")
         else:
             print(f"The formula is invalid in irreflexive 2-dimensional Minkowski spacetime.")
+        print(f"The formula was decided by the {TIERS[formula.tier]}.")
 
     except ParseError:
         print("Incorrectly formulated temporal formula.")
     except Exception as e:
         print("An error occurred.")
 
-start_time = time.time()
-main()
-end_time = time.time()
+if __name__ == '__main__':
+    start_time = time.time()
+    main()
+    end_time = time.time()
 
-elapsed_time = end_time - start_time
-print(f"Elapsed time: {elapsed_time:.6f} seconds")
+    elapsed_time = end_time - start_time
+    print(f"Elapsed time: {elapsed_time:.6f} seconds")
 
 
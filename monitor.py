@@ -0,0 +1,118 @@
+import json
+
+from mcs_tables import bits_of
+from subformula_cache import SubformulaCache
+
+# Runtime monitor for real-time.py.
+# Events are valuations of atoms observed at increasing times on the real line. A maximal consistent set is
+# compatible with the events so far if it agrees with the last event and is reached from a set agreeing with the
+# first event through sets agreeing with the events in between, each accessing the next. Compatible sets are kept
+# as integer bitsets over the rows of the mcs table, split by whether the chain starts in a set containing the
+# formula, so that each event costs a few bitset operations.
+
+
+class Monitor:
+
+    # The number of bitsets whose successors are memoised, the least recently used being dropped first
+    MEMO_SIZE = 4096
+
+    def __init__(self, formula):
+        # Chains refuting the formula start outside the sets reachable from it, so they must not be pruned
+        if formula.mcs_table is None:
+            formula.pruning = False
+        elif formula.pruned:
+            raise ValueError("The monitor needs the maximal consistent sets that pruning removed.")
+        self.formula = formula
+        self.mcs_table = formula.get_mcs_table()
+        access_matrix = formula.get_access_matrix()
+        self.after = [access_matrix.row(row) for row in range(len(self.mcs_table))]
+        self.everything = (1 << len(self.mcs_table)) - 1
+        self.holding = 0
+        for row in self.mcs_table.containing(formula.formula):
+            self.holding |= 1 << row
+        # For each atom, the sets containing it
+        self.valuations = {}
+        for atom in formula.get_atoms():
+            self.valuations[atom] = 0
+            for row in self.mcs_table.containing(atom):
+                self.valuations[atom] |= 1 << row
+        self.successors = SubformulaCache(self.MEMO_SIZE)
+        self.reset()
+
+    # Forgets the events consumed so far
+    def reset(self):
+        self.positive = None
+        self.negative = None
+        self.time = None
+        self.events = 0
+
+    # Returns the sets after some set in a bitset; memoised, as the same bitsets recur along a stream, in a least
+    # recently used cache so that long streams of changing bitsets do not grow it without bound
+    def successors_of(self, compatible):
+        after = self.successors.get(compatible)
+        if after is None:
+            after = 0
+            for row in bits_of(compatible):
+                after |= self.after[row]
+            self.successors.put(compatible, after)
+        return after
+
+    # Returns the sets agreeing with a valuation {atom: bool}; atoms outside the formula are ignored
+    def agreeing(self, valuation):
+        rows = self.everything
+        for atom, value in valuation.items():
+            if atom in self.valuations:
+                if value:
+                    rows &= self.valuations[atom]
+                else:
+                    rows &= ~self.valuations[atom]
+        return rows
+
+    # Consumes the valuation observed at a given time; returns the verdict
+    def step(self, time, valuation):
+        if self.time is not None and not time > self.time:
+            raise ValueError(f"The event at time {time} does not come after the event at time {self.time}.")
+        rows = self.agreeing(valuation)
+        if self.positive is None:
+            self.positive = rows & self.holding
+            self.negative = rows & ~self.holding
+        else:
+            self.positive = self.successors_of(self.positive) & rows
+            self.negative = self.successors_of(self.negative) & rows
+        self.time = time
+        self.events += 1
+        return self.verdict()
+
+    # Returns 'violated' if no compatible chain starts in a set containing the formula, 'satisfied' if every one
+    # does, 'inconsistent' if no set is compatible and 'undecided' otherwise
+    def verdict(self):
+        if self.positive is None:
+            return 'undecided'
+        if self.positive == 0 and self.negative == 0:
+            return 'inconsistent'
+        if self.positive == 0:
+            return 'violated'
+        if self.negative == 0:
+            return 'satisfied'
+        return 'undecided'
+
+    # Consumes events, given as dictionaries with the time under 't' and the atoms as the other keys; yields the
+    # time and the verdict after each event
+    def run(self, events):
+        for event in events:
+            valuation = dict(event)
+            time = valuation.pop('t')
+            yield time, self.step(time, valuation)
+
+    # Returns the maximal consistent sets compatible with the events so far, as sets of strings
+    def compatible(self):
+        if self.positive is None:
+            return self.mcs_table.to_sets()
+        return self.mcs_table.to_sets(list(bits_of(self.positive | self.negative)))
+
+
+# Reads events from JSON lines such as {"t": 0.5, "p": true, "q": false}, skipping blank lines
+def read_events(lines):
+    for line in lines:
+        if line.strip():
+            yield json.loads(line)
@@ -0,0 +1,33 @@
+# Orderings of the filtration search of real-time.py, shared by TemporalFormula.compute_model and row_search.RowSearch.
+# Each ordering takes the search, the previous element of the model and the candidates, and returns the candidates in
+# the order to try them. A search gives the future defects of an element with future_defect, the number of those
+# defects an element cures with count_cured and the number of maximal consistent sets after an element with
+# count_after, whether its elements are sets of strings or rows.
+
+
+def default_order(search, previous, candidates):
+    return candidates
+
+def reversed_order(search, previous, candidates):
+    return candidates[::-1]
+
+# Tries first the candidates that cure the most future defects of the previous element
+def most_cured_order(search, previous, candidates):
+    defects = search.future_defect(previous)
+    return sorted(candidates, key=lambda candidate: search.count_cured(defects, candidate), reverse=True)
+
+# Tries first the candidates with the fewest future defects of their own
+def fewest_defects_order(search, previous, candidates):
+    return sorted(candidates, key=lambda candidate: len(search.future_defect(candidate)))
+
+# Tries first the candidates with the fewest maximal consistent sets after them
+def closest_to_top_order(search, previous, candidates):
+    return sorted(candidates, key=search.count_after)
+
+ORDERINGS = {
+    'default': default_order,
+    'reversed': reversed_order,
+    'most-cured': most_cured_order,
+    'fewest-defects': fewest_defects_order,
+    'closest-to-top': closest_to_top_order,
+}
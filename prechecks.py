@@ -0,0 +1,136 @@
+from mcs_tables import holds
+from subformula_cache import closure_clauses, satisfies
+
+# Quick tests shared by real-time.py and minkowski-spacetime.py, run before the full check.
+# Tier 1 treats the temporal subformulas as atoms: a formula that is propositionally unsatisfiable over them is
+# unsatisfiable in every flow of time. Tier 2 looks for a constant valuation, under which every point satisfies the same
+# formulas. Every point of the real line has points after and before it, so under a constant valuation FA, PA, GA and HA
+# all amount to A, and a formula satisfied once its temporal operators are erased is satisfied everywhere, provided the
+# set of formulas holding everywhere is a maximal consistent set of the closure. Tier 2 is run for the real line only:
+# the check of minkowski-spacetime.py rejects formulas that a constant valuation satisfies, such as FFp, PPPFq,
+# (p>F~Hp), F~GFq, FHFFq, PGH~p, F~PPq and ((PPp&p)>p). Propositional satisfiability is decided on every valuation at
+# once: bit i of a truth table is the value under valuation i. The tests are skipped for formulas of more than
+# MAX_VARIABLES variables.
+
+MAX_VARIABLES = 20
+
+# Descriptions of the tiers recorded by the checkers
+TIERS = {
+    'propositional': "propositional precheck",
+    'constant': "constant valuation precheck",
+    'full': "full check",
+}
+
+
+# Returns the variables of a parsed formula: its atoms, and unless erase, its outermost temporal subformulas
+def skeleton_variables(formula, erase):
+    text = formula.formula
+    stack = []
+    for start, end, connective in formula.subformulas:
+        if connective != -1:
+            right = stack.pop()
+            stack.append(stack.pop() | right)
+        elif end - start == 1:
+            stack.append(frozenset(text[start]))
+        elif text[start] != '~' and not erase:
+            stack.pop()
+            stack.append(frozenset([text[start:end]]))
+    return stack[-1]
+
+
+# Returns the truth tables of variables, and the table of the constant true
+def truth_tables(variables):
+    everything = (1 << (1 << len(variables))) - 1
+    tables = {}
+    for i, variable in enumerate(variables):
+        half = 1 << i
+        # Blocks of half zeros then half ones, repeated over all the valuations
+        tables[variable] = (((1 << half) - 1) << half) * (everything // ((1 << 2 * half) - 1))
+    return tables, everything
+
+
+# Returns the truth table of a parsed formula given those of its variables; erase drops the temporal operators.
+# Without erase, the subformulas of temporal variables are evaluated too, to 0, but their values are discarded
+def skeleton_table(formula, erase, tables, everything):
+    text = formula.formula
+    stack = []
+    for start, end, connective in formula.subformulas:
+        if connective != -1:
+            right = stack.pop()
+            left = stack.pop()
+            if text[connective] == '&':
+                stack.append(left & right)
+            elif text[connective] == '|':
+                stack.append(left | right)
+            else:
+                stack.append((everything ^ left) | right)
+        elif end - start == 1:
+            stack.append(tables.get(text[start], 0))
+        elif text[start] == '~':
+            stack.append(everything ^ stack.pop())
+        elif not erase:
+            stack.pop()
+            stack.append(tables.get(text[start:end], 0))
+    return stack[-1]
+
+
+# Returns the variables of a parsed formula and its truth table over them, or None if it has too many variables
+def satisfying_valuations(formula, erase):
+    variables = sorted(skeleton_variables(formula, erase))
+    if len(variables) > MAX_VARIABLES:
+        return None
+    tables, everything = truth_tables(variables)
+    return variables, skeleton_table(formula, erase, tables, everything)
+
+
+# Tier 1: checks if a parsed formula is unsatisfiable with its temporal subformulas treated as atoms
+def propositionally_unsatisfiable(formula):
+    valuations = satisfying_valuations(formula, False)
+    return valuations is not None and valuations[1] == 0
+
+
+# Tier 2: returns a constant valuation {atom: bool} satisfying a parsed formula, or None if none is found
+def constant_valuation(formula):
+    valuations = satisfying_valuations(formula, True)
+    if valuations is None or valuations[1] == 0:
+        return None
+    variables, table = valuations
+    first = (table & -table).bit_length() - 1
+    return {atom: bool(first >> i & 1) for i, atom in enumerate(variables)}
+
+
+# Returns the maximal consistent set holding at every point of the real line under a constant valuation, decoded
+# from its bitmask over the closure index, or None if that bitmask is not a consistent set accessing itself with
+# every eventuality in it fulfilled in it. It is not for formulas with double negations, as ~~A is in no set
+def constant_mcs(formula, valuation):
+    text = formula.formula
+    truth = {}
+    stack = []
+    for start, end, connective in formula.subformulas:
+        if connective != -1:
+            right = stack.pop()
+            left = stack.pop()
+            if text[connective] == '&':
+                stack.append(left and right)
+            elif text[connective] == '|':
+                stack.append(left or right)
+            else:
+                stack.append(not left or right)
+        elif end - start == 1:
+            stack.append(valuation[text[start]])
+        elif text[start] == '~':
+            stack.append(not stack.pop())
+        truth[text[start:end]] = stack[-1]
+    index = formula.get_closure_index()
+    mask = 0
+    for bit, member in enumerate(index.members):
+        if truth[member]:
+            mask |= 1 << bit
+    if not satisfies(mask, closure_clauses(type(formula), index.members)) or not index.access(mask, mask):
+        return None
+    if not holds(index.literal(text), mask):
+        return None
+    for defect, cure in index.future + index.past:
+        if holds(defect, mask) and not holds(cure, mask):
+            return None
+    return index.decode(mask)
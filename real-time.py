@@ -1,4 +1,23 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
 import time
+from array import array
+from functools import partial
+from multiprocessing import Pool
+
+from checkpoint import Checkpoint
+from cost import admit, estimate_cost, read_calibration
+from mcs_tables import AccessMatrix, ClosureIndex, ClusterTable, MCSStore, MCSTable, holds, read_tables, write_tables
+from monitor import Monitor, read_events
+from orderings import ORDERINGS
+from prechecks import TIERS, constant_mcs, constant_valuation, propositionally_unsatisfiable
+from row_search import RowSearch
+from simplify import map_model, simplify_formula
+from subformula_cache import CACHE, closure, closure_clauses, consistent_assignments, consistent_in
+from symbolic import SymbolicEngine
 
 class ParseError(Exception):
     '''Raised when a given formula has incorrect formulation.'''
@@ -9,8 +28,28 @@ class TemporalFormula:
         if not isinstance(formula_string, str):
             raise TypeError("Formula must be a string.")
         self.formula = formula_string
-        if not self.parse():
-            raise ParseError("Incorrectly formulated temporal formula.")
+        self.closure_index = None
+        self.mcs_table = None
+        self.cluster_table = None
+        self.irref_rows = None
+        self.access_matrix = None
+        self.pruning = True
+        self.pruned = 0
+        self.views = None
+        self.memory_ceiling = None
+        self.strategy = None
+        self.tier = None
+        self.search_stats = {'expanded': 0, 'backtracked': 0}
+        self.checkpoint = None
+        self.resuming = False
+        self.resumed = None
+        # The parse of a formula string is shared by all its instances through the subformula cache
+        self.subformulas = CACHE.get(('parse', formula_string))
+        if self.subformulas is None:
+            if not self.parse():
+                raise ParseError("Incorrectly formulated temporal formula.")
+            self.subformulas = tuple(self.subformulas)
+            CACHE.put(('parse', formula_string), self.subformulas, 1 + len(self.subformulas))
     def __str__(self):
         return self.formula
 
@@ -47,44 +86,21 @@ class TemporalFormula:
     # Returns left subformula as a TemporalFormula object
     def left_subformula(self):
         if self.formula[0] == '(':
-            left_bracket_counter = 1
-            for i in range(1, len(self.formula)):
-                if self.formula[i] == '(':
-                    left_bracket_counter += 1
-                elif self.formula[i] == ')':
-                    left_bracket_counter -= 1
-                elif self.connective(i) and left_bracket_counter == 1:
-                    formula_no_bracket = self.formula[1:-1]
-                    return TemporalFormula(formula_no_bracket[:i - 1])
+            return TemporalFormula(self.formula[1:self.subformulas[-1][2]])
         else:
             return self
 
     # Returns right subformula as a TemporalFormula object
     def right_subformula(self):
         if self.formula[0] == '(':
-            left_bracket_counter = 1
-            for i in range(1, len(self.formula)):
-                if self.formula[i] == '(':
-                    left_bracket_counter += 1
-                elif self.formula[i] == ')':
-                    left_bracket_counter -= 1
-                elif self.connective(i) and left_bracket_counter == 1:
-                    formula_no_bracket = self.formula[1:-1]
-                    return TemporalFormula(formula_no_bracket[i:])
+            return TemporalFormula(self.formula[self.subformulas[-1][2] + 1:-1])
         else:
             return self
 
     # Returns connective that is within 1 bracket access
     def conjunction(self):
         if self.formula[0] == '(':
-            left_bracket_counter = 1
-            for i in range(1, len(self.formula)):
-                if self.formula[i] == '(':
-                    left_bracket_counter += 1
-                elif self.formula[i] == ')':
-                    left_bracket_counter -= 1
-                elif self.connective(i) and left_bracket_counter == 1:
-                    return self.formula[i]
+            return self.formula[self.subformulas[-1][2]]
 
     # Expands ~(.) type formulas into (.)
     def expand(self):
@@ -102,164 +118,310 @@ class TemporalFormula:
         else:
             return self
 
-    # Checks whether the specified formula is correctly formulated
+    # Checks whether the specified formula is correctly formulated. The formula is read once from left to right with
+    # an explicit stack of the subformulas still open, so deeply nested formulas do not recurse. Every subformula is
+    # recorded as (start, end, connective): its index range and the index of its connective, -1 if it has none.
+    # Subformulas are recorded before the formulas containing them; the whole formula comes last
     def parse(self):
-        if len(self.formula) == 0:
-            return False
-        elif not self.prop(0) and not self.operator(0) and self.formula[0]!='(':
-            return False
-        elif self.prop(0):
-            if len(self.formula) == 1:
-                return True
-            else:
+        formula = self.formula
+        subformulas = []
+        stack = []
+        position = 0
+        while True:
+            if position == len(formula):
                 return False
-        elif self.operator(0):
-            formula_no_operator = TemporalFormula(self.formula[1:])
-            return formula_no_operator.parse()
-        elif self.formula[0] == '(':
-            if self.formula[-1]!=')':
+            if self.operator(position) or formula[position] == '(':
+                stack.append([position, -1])
+                position += 1
+                continue
+            if not self.prop(position):
                 return False
+            end = position + 1
+            subformulas.append((position, end, -1))
+
+            # Closes the open subformulas that end here
+            while stack:
+                start, connective = stack[-1]
+                if formula[start] != '(':
+                    subformulas.append((start, end, -1))
+                elif connective == -1:
+                    if end == len(formula) or not self.connective(end):
+                        return False
+                    stack[-1][1] = end
+                    break
+                else:
+                    if end == len(formula) or formula[end] != ')':
+                        return False
+                    end += 1
+                    subformulas.append((start, end, connective))
+                stack.pop()
+
+            if not stack:
+                if end != len(formula):
+                    return False
+                self.subformulas = subformulas
+                return True
+            position = stack[-1][1] + 1
+
+    # Returns an equivalent formula with a smaller closure, rewritten under the equivalences of this flow of time
+    def simplify(self):
+        return TemporalFormula(simplify_formula(self, 'real-line'))
+
+    # Returns the estimated cost of checking the formula with each engine, as cost.estimate_cost, from its closure
+    # alone
+    def estimate_cost(self, calibration=None):
+        return estimate_cost(self, 'real-line', calibration)
+
+    # Returns the set of atomic propositions occurring in the formula
+    def get_atoms(self):
+        return {char for char in self.formula if char.isalpha() and char.islower()}
+
+    # Splits the formula along its top-level conjunctions: returns the conjuncts and the conjunctions joining them
+    def get_conjuncts(self):
+        connectives = {(start, end): connective for start, end, connective in self.subformulas}
+        conjuncts = []
+        conjunctions = []
+        stack = [(0, len(self.formula))]
+        while stack:
+            start, end = stack.pop()
+            connective = connectives[(start, end)]
+            if connective != -1 and self.formula[connective] == '&':
+                conjunctions.append(self.formula[start:end])
+                stack.append((connective + 1, end - 1))
+                stack.append((start + 1, connective))
             else:
-                left_bracket_counter = 1
-                for i in range(1, len(self.formula)):
-                    if self.formula[i] == '(':
-                        left_bracket_counter += 1
-                    elif self.formula[i] == ')':
-                        left_bracket_counter -= 1
-                    elif self.connective(i) and left_bracket_counter == 1:
-                        formula_no_bracket = self.formula[1:-1]
-                        list_of_subformulas = [TemporalFormula(formula_no_bracket[:i - 1]),
-                                               TemporalFormula(formula_no_bracket[i:])]
-                        return all(subformula.parse() for subformula in list_of_subformulas)
+                conjuncts.append(TemporalFormula(self.formula[start:end]))
+        return conjuncts, conjunctions
+
+    # Groups the top-level conjuncts into components that share no atoms: returns one conjunction per component
+    def get_components(self):
+        conjuncts, conjunctions = self.get_conjuncts()
+        if len(conjuncts) == 1:
+            return [self]
+
+        # Union-find over the atoms, so that conjuncts sharing an atom end up in the same component
+        parent = {}
+
+        def find(atom):
+            while parent.setdefault(atom, atom) != atom:
+                parent[atom] = parent[parent[atom]]
+                atom = parent[atom]
+            return atom
+
+        for conjunct in conjuncts:
+            atoms = sorted(conjunct.get_atoms())
+            for atom in atoms[1:]:
+                parent[find(atom)] = find(atoms[0])
+
+        groups = {}
+        for conjunct in conjuncts:
+            root = find(min(conjunct.get_atoms()))
+            if conjunct.formula not in groups.setdefault(root, []):
+                groups[root].append(conjunct.formula)
+
+        components = []
+        for group in groups.values():
+            formula_string = group[-1]
+            for conjunct in reversed(group[:-1]):
+                formula_string = '(' + conjunct + '&' + formula_string + ')'
+            component = TemporalFormula(formula_string)
+            component.pruning = self.pruning
+            component.memory_ceiling = self.memory_ceiling
+            components.append(component)
+        return components
 
     # Returns the closure set of the specified formula
     def get_closure_set(self):
+        return set(closure(self))
 
-        closure_set = set()
-
-        if len(self.formula) == 1:
-            new_items = {self.formula, self.negation().formula}
-            closure_set.update(new_items)
-
-            return closure_set
-
-        elif self.operator(0):
-            operator_subformula = TemporalFormula(self.formula[1:])
-            new_items = {self.formula, self.negation().formula}
-            closure_set.update(new_items)
-            closure_set.update(operator_subformula.get_closure_set())
-
-            return closure_set
-
-        elif self.formula[0] == '(':
-
-            bracket_counter = 1
-
-            for i in range(1, len(self.formula)):
-                if self.formula[i] == '(':
-                    bracket_counter += 1
-                elif self.formula[i] == ')':
-                    bracket_counter -= 1
-                elif self.connective(i) and bracket_counter == 1:
-                    inner_formula = self.formula[1:-1]
-                    left_subformula = TemporalFormula(inner_formula[:i - 1])
-                    right_subformula = TemporalFormula(inner_formula[i:])
-                    new_items = {self.formula, self.negation().formula}
-                    closure_set.update(new_items)
-                    closure_set.update(left_subformula.get_closure_set())
-                    closure_set.update(right_subformula.get_closure_set())
-
-                    return closure_set
-
+    # Returns the bit index of the non-negated members of the closure set, used by the compact tables
+    def get_closure_index(self):
+        if self.closure_index is None:
+            self.closure_index = ClosureIndex(self.get_closure_set())
+        return self.closure_index
 
     # Returns a list of choice sets of the specified formula
     def get_choice_set(self):
-        subformulas = []
-        list_of_choice_sets = []
-
-        for subformula in self.get_closure_set():
-            if not subformula[0] == '~':
-                subformulas.append(subformula)
-
-        for i in range(2 ** len(subformulas)):
-            choice_set = set()
-
-            combo = bin(i)[2:].zfill(len(subformulas))
-
-            for j in range(len(subformulas)):
-                temp = TemporalFormula(subformulas[j])
-                if combo[j] == '1':
-                    choice_set.add(temp.formula)
-                else:
-                    choice_set.add(temp.negation().formula)
-
-            list_of_choice_sets.append(choice_set)
-
-        return list_of_choice_sets
-
-    # Returns a list of maximal propositionally consistent sets from the list of a choice set for a given formula
-    def get_mc_set(self):
-
-        # Checks that a set is propositionally consistent
-        def is_consistent(choice_set):
-            temp_set = set()
-            for subformula in choice_set:
-                temp_set.add(TemporalFormula(subformula).expand())
-            for formula in temp_set:
-                if "~HF"+formula.formula in choice_set:
+        index = self.get_closure_index()
+        return [index.decode(mask) for mask in range(2 ** len(index))]
+
+    # Checks that a set is propositionally consistent
+    def is_consistent(self, choice_set):
+        temp_set = set()
+        for subformula in choice_set:
+            temp_set.add(TemporalFormula(subformula).expand())
+        for formula in temp_set:
+            if "~HF"+formula.formula in choice_set:
+                return False
+            if "~GP"+formula.formula in choice_set:
+                return False
+            if formula.formula.startswith("F"):
+                if "G~"+formula.formula[1:] in choice_set:
                     return False
-                if "~GP"+formula.formula in choice_set:
+            if formula.formula.startswith("P"):
+                if "H~"+formula.formula[1:] in choice_set:
                     return False
-                if formula.formula.startswith("F"):
-                    if "G~"+formula.formula[1:] in choice_set:
-                        return False
-                if formula.formula.startswith("P"):
-                    if "H~"+formula.formula[1:] in choice_set:
-                        return False
-                if formula.formula.startswith("G"):
-                    if "F~"+formula.formula[1:] in choice_set:
-                        return False
-                if formula.formula.startswith("H"):
-                    if "P~"+formula.formula[1:] in choice_set:
-                        return False
-                if formula.formula.startswith("~F"):
-                    if "~G~"+formula.formula[2:] in choice_set:
-                        return False
-                if formula.formula.startswith("~P"):
-                    if "~H~"+formula.formula[2:] in choice_set:
-                        return False
-                if formula.formula.startswith("~G"):
-                    if "~F~"+formula.formula[2:] in choice_set:
-                        return False
-                if formula.formula.startswith("~H"):
-                    if "~P~"+formula.formula[2:] in choice_set:
-                        return False
-                if formula.conjunction() == "|":
-                    if formula.left_subformula().formula not in choice_set:
-                        if formula.right_subformula().formula not in choice_set:
-                            return False
-                if formula.conjunction() == "&":
-                    if formula.left_subformula().formula not in choice_set:
+            if formula.formula.startswith("G"):
+                if "F~"+formula.formula[1:] in choice_set:
+                    return False
+            if formula.formula.startswith("H"):
+                if "P~"+formula.formula[1:] in choice_set:
+                    return False
+            if formula.formula.startswith("~F"):
+                if "~G~"+formula.formula[2:] in choice_set:
+                    return False
+            if formula.formula.startswith("~P"):
+                if "~H~"+formula.formula[2:] in choice_set:
+                    return False
+            if formula.formula.startswith("~G"):
+                if "~F~"+formula.formula[2:] in choice_set:
+                    return False
+            if formula.formula.startswith("~H"):
+                if "~P~"+formula.formula[2:] in choice_set:
+                    return False
+            if formula.conjunction() == "|":
+                if formula.left_subformula().formula not in choice_set:
+                    if formula.right_subformula().formula not in choice_set:
                         return False
+            if formula.conjunction() == "&":
+                if formula.left_subformula().formula not in choice_set:
+                    return False
+                if formula.right_subformula().formula not in choice_set:
+                    return False
+            if formula.conjunction() == ">":
+                if formula.left_subformula().formula in choice_set:
                     if formula.right_subformula().formula not in choice_set:
                         return False
-                if formula.conjunction() == ">":
-                    if formula.left_subformula().formula in choice_set:
-                        if formula.right_subformula().formula not in choice_set:
-                            return False
-            return True
-
-        list_of_mc_sets = []
+        return True
 
-        for choice_set in self.get_choice_set():
-            if is_consistent(choice_set):
-                # if density(choice_set):
-                list_of_mc_sets.append(choice_set)
+    # Returns the table of maximal consistent sets. The consistent choice sets are joined from those of the
+    # subformulas, which are shared with other formulas through the subformula cache
+    def get_mcs_table(self):
+        if self.mcs_table is None:
+            index = self.get_closure_index()
+            if self.memory_ceiling is None:
+                members, masks = consistent_assignments(self, *self.enumeration_checkpoint())
+                mcs_table = MCSTable(index, array('Q', masks))
+            else:
+                mcs_table = MCSStore(index, self.memory_ceiling)
+                consistent_assignments(self, *self.enumeration_checkpoint(), output=mcs_table)
+                mcs_table.seal()
+            if self.pruning:
+                mcs_table = self.prune(mcs_table)
+            self.mcs_table = mcs_table
+            if self.checkpoint is not None:
+                self.save_checkpoint('mcs', {}, f"Enumeration complete: {len(mcs_table)} maximal consistent sets.")
+        return self.mcs_table
+
+    # Keeps only the maximal consistent sets reachable forwards or backwards from one containing the formula:
+    # no other set can appear in a model
+    def prune(self, mcs_table):
+        sources = mcs_table.containing(self.formula)
+        rows = set(mcs_table.reachable(sources, True)) | set(mcs_table.reachable(sources, False))
+        self.pruned = len(mcs_table) - len(rows)
+        return mcs_table.subtable(rows)
+
+    # Checkpoints the filtration check to a Checkpoint at its interval. With resume, continues from the state saved
+    # in it: the tables completed before the checkpoint are restored at once and the interrupted stage picks up the
+    # rest. The stages are 'enumeration', 'mcs' (enumeration complete), 'clusters', 'tables' (clusters complete),
+    # 'search' and 'done'
+    def use_checkpoint(self, checkpoint, resume=False):
+        self.checkpoint = checkpoint
+        self.resuming = resume
+        self.resumed = checkpoint.load() if resume else None
+        if self.resumed is None:
+            return
+        if self.resumed['formula'] != self.formula or self.resumed['pruning'] != self.pruning:
+            raise ValueError("The checkpoint was saved for a different formula.")
+        if self.resumed['stage'] != 'enumeration':
+            self.mcs_table = MCSTable(self.get_closure_index(), self.resumed['rows'])
+            self.pruned = self.resumed['pruned']
+        if self.resumed['stage'] in ('tables', 'search', 'done'):
+            self.cluster_table = ClusterTable(self.mcs_table, self.resumed['members'], self.resumed['bounds'])
+            self.irref_rows = self.resumed['irref']
+
+    # Saves the state of a stage to the checkpoint, with the tables completed before it, and reports the progress
+    def save_checkpoint(self, stage, state, message):
+        state.update(formula=self.formula, pruning=self.pruning, stage=stage)
+        if stage != 'enumeration':
+            state.update(rows=array('Q', self.mcs_table.rows), pruned=self.pruned)
+        if stage in ('tables', 'search', 'done'):
+            state.update(members=array('I', self.cluster_table.members), bounds=array('I', self.cluster_table.bounds),
+                         irref=array('I', self.irref_rows))
+        self.checkpoint.save(state, message)
+
+    # Returns the subformula assignments saved by an interrupted enumeration and a callback checkpointing the
+    # enumeration, as the arguments of consistent_assignments
+    def enumeration_checkpoint(self):
+        if self.checkpoint is None:
+            return None, None
+        computed = None
+        if self.resumed is not None and self.resumed['stage'] == 'enumeration':
+            computed = self.resumed['computed']
+
+        def progress(position, total, computed):
+            if self.checkpoint.due():
+                self.save_checkpoint('enumeration', {'computed': computed},
+                                     f"Enumeration: {100 * position // total}% of the subformulas joined.")
+
+        return computed, progress
 
-        return list_of_mc_sets
+    # Returns a list of maximal propositionally consistent sets from the list of a choice set for a given formula
+    def get_mc_set(self):
+        mcs_table = self.get_mcs_table()
+        return self.view('mc_set', mcs_table, mcs_table.to_sets)
+
+    # Returns a list of sets of strings computed by convert from a table. While a check keeps views, the list is
+    # computed once per table, as the check asks for the same lists over and over, and a copy of it is returned;
+    # otherwise it is computed on every call, so that only the tables stay in memory between checks
+    def view(self, name, table, convert):
+        if self.views is None:
+            return convert()
+        if name not in self.views or self.views[name][0] is not table:
+            self.views[name] = (table, convert())
+        return list(self.views[name][1])
+
+    # Runs a check with the lists computed by view kept until it returns, unless a caller keeps them already
+    def keeping_views(self, check, *args):
+        if self.views is not None:
+            return check(*args)
+        self.views = {}
+        try:
+            return check(*args)
+        finally:
+            self.views = None
+
+    # Returns the access relation between the rows of the mcs table as a bit-packed matrix
+    def get_access_matrix(self):
+        if self.access_matrix is None:
+            self.access_matrix = AccessMatrix.build(self.get_mcs_table())
+        return self.access_matrix
+
+    # Writes the closure set, maximal consistent sets, access matrix, clusters and irreflexive sets to a binary file
+    def export_tables(self, path):
+        write_tables(path, self.formula, self.get_closure_set(), self.get_mcs_table(), self.get_access_matrix(),
+                     self.get_cluster_table(), self.irref_rows, self.pruned)
+
+    # Maps the tables of this formula from a binary file written by export_tables, without copying them
+    def import_tables(self, path):
+        formula_string, closure_set, mcs_table, access_matrix, cluster_table, irref_rows, pruned = read_tables(path)
+        if formula_string != self.formula or closure_set != self.get_closure_set():
+            raise ValueError("The tables were computed for a different formula.")
+        self.closure_index = mcs_table.index
+        self.mcs_table = mcs_table
+        self.access_matrix = access_matrix
+        self.cluster_table = cluster_table
+        self.irref_rows = irref_rows
+        self.pruned = pruned
 
     # Checks if a set m can access a set n i.e. m<n
     def access(self, m, n):
+        # The matrix only covers the sets in the table; any other set, e.g. a pruned one, is compared by its members
+        if self.access_matrix is not None:
+            index = self.closure_index
+            row, column = self.mcs_table.find(index.encode(m)), self.mcs_table.find(index.encode(n))
+            if row >= 0 and column >= 0:
+                return self.access_matrix.get(row, column) == 1
         for subformula in self.get_closure_set():
             if subformula.startswith("F"):
                 if subformula in n:
@@ -322,53 +484,73 @@ class TemporalFormula:
         else:
             return False
 
+    # Computes the cluster table and the rows of the irreflexive maximal consistent sets
+    def get_cluster_table(self):
+        if self.cluster_table is None:
+            mcs_table = self.get_mcs_table()
+            index = mcs_table.index
+            cluster_table = ClusterTable(mcs_table)
+            irref_rows = array('I')
+            clustered = bytearray(len(mcs_table))
+            start = 0
+            if self.resumed is not None and self.resumed['stage'] == 'clusters':
+                cluster_table = ClusterTable(mcs_table, self.resumed['members'], self.resumed['bounds'])
+                irref_rows = self.resumed['irref']
+                clustered = self.resumed['clustered']
+                start = self.resumed['row']
+            for row in range(start, len(mcs_table)):
+                if self.checkpoint is not None and self.checkpoint.due():
+                    self.save_checkpoint('clusters', {'row': row, 'clustered': clustered, 'irref': irref_rows,
+                                                      'members': cluster_table.members,
+                                                      'bounds': cluster_table.bounds},
+                                         f"Clusters: {100 * row // len(mcs_table)}% of the maximal consistent sets "
+                                         f"classified.")
+                if clustered[row]:
+                    continue
+                mask = mcs_table[row]
+                if not index.access(mask, mask):
+                    irref_rows.append(row)
+                    continue
+                # The cluster [m] consists of the sets n with m<n and n<m
+                successors = index.successor_cube(mask)
+                predecessors = index.predecessor_cube(mask)
+                cluster = []
+                for n in mcs_table.matching(successors):
+                    if mcs_table[n] & predecessors[0] == predecessors[1]:
+                        cluster.append(n)
+                        clustered[n] = 1
+                cluster_table.append(cluster)
+            self.cluster_table = cluster_table
+            self.irref_rows = irref_rows
+            if self.checkpoint is not None:
+                self.save_checkpoint('tables', {}, f"Classification complete: {len(cluster_table)} clusters and "
+                                                   f"{len(irref_rows)} irreflexive maximal consistent sets.")
+        return self.cluster_table
+
     # Returns a list of all clusters for a given temporal formula
     def list_of_clusters(self):
 
-        # Given a reflexive mcs, returns the corresponding cluster [m]
-        def get_cluster(m):
-            if self.is_reflexive(m):
-                cluster = [m]
-                for n in self.get_mc_set():
-                    if self.access(m, n) and self.access(n, m):
-                        if n not in cluster:
-                            cluster.append(n)
-                return cluster
-            else:
-                return None
-
-        list_of_clusters = []
-
-        for mcs in self.get_mc_set():
-            if self.is_reflexive(mcs):
-                cluster = get_cluster(mcs)
-                cluster_list = sorted([list(subset) for subset in cluster])
-                if cluster_list not in list_of_clusters:
-                    list_of_clusters.append(cluster_list)
-
-        converted_clusters = []
+        def sort_clusters():
+            converted_clusters = self.get_cluster_table().to_sets()
+            sorted_clusters = sorted(converted_clusters,
+                                     key=lambda cluster:[self.precedes(cluster, other)
+                                                         for other in converted_clusters], reverse=True)
+            return sorted_clusters
 
-        for cluster in list_of_clusters:
-            converted_cluster = []
-            for subset in cluster:
-                converted_cluster.append(set(subset))
-            converted_clusters.append(converted_cluster)
-
-        sorted_clusters = sorted(converted_clusters,
-                                 key=lambda cluster:[self.precedes(cluster, other)
-                                                     for other in converted_clusters], reverse=True)
-        return sorted_clusters
+        return self.view('clusters', self.get_cluster_table(), sort_clusters)
 
     # Returns a list of irreflexive maximal consistent sets
     def list_of_irref_mcs(self):
-        list_of_irref_mcs = []
-        for mcs in self.get_mc_set():
-            if not self.is_reflexive(mcs):
-                list_of_irref_mcs.append(mcs)
-        sorted_irref_mcs = sorted(list_of_irref_mcs,
-                                 key=lambda mcs: [self.access(mcs, other) for other in list_of_irref_mcs],
-                                 reverse=True)
-        return sorted_irref_mcs
+
+        def sort_irref_mcs():
+            list_of_irref_mcs = self.mcs_table.to_sets(self.irref_rows)
+            sorted_irref_mcs = sorted(list_of_irref_mcs,
+                                     key=lambda mcs: [self.access(mcs, other) for other in list_of_irref_mcs],
+                                     reverse=True)
+            return sorted_irref_mcs
+
+        self.get_cluster_table()
+        return self.view('irref_mcs', self.irref_rows, sort_irref_mcs)
 
     # Checks if c<d, where c,d are clusters
     def precedes(self, c, d):
@@ -392,208 +574,833 @@ class TemporalFormula:
                 return False
         return True
 
-    # Computes the model; returns False if no model exists
-    def get_model(self):
-
-        # Finds the future defects in a cluster: returns a dictionary {defect: cure} e.g. {Fm: [Fm, m]}
-        def future_defect(cluster):
-            future_defects = {}
-            if isinstance(cluster, set):
-                cluster = [cluster]
-            for mcs in cluster:
-                for subformula in mcs:
-                    if subformula.startswith("F"):
-                        add_defect = True
-                        for s in cluster:
-                            if subformula[1:] in s:
-                                add_defect = False
-                                break
-                        if add_defect:
-                            future_defects[subformula] = [subformula, subformula[1:]]
-                    elif subformula.startswith("~G"):
-                        add_defect = True
-                        for s in cluster:
-                            if TemporalFormula(subformula[2:]).negation().formula in s:
-                                add_defect = False
-                                break
-                        if add_defect:
-                            future_defects[subformula] = [subformula, TemporalFormula(subformula[2:]).negation().formula]
-            return future_defects
-
-        # Finds the past defects in a cluster: returns a dictionary {defect: cure} e.g. {Pm: [Pm, m]}
-        def past_defect(cluster):
-            past_defects = {}
-            if isinstance(cluster, set):
-                cluster = [cluster]
-            for mcs in cluster:
-                for subformula in mcs:
-                    if subformula.startswith("P"):
-                        add_defect = True
-                        for s in cluster:
-                            if subformula[1:] in s:
-                                add_defect = False
-                                break
-                        if add_defect:
-                            past_defects[subformula] = [subformula, subformula[1:]]
-                    elif subformula.startswith("~H"):
-                        add_defect = True
-                        for s in cluster:
-                            if TemporalFormula(subformula[2:]).negation().formula in s:
-                                add_defect = False
-                                break
-                        if add_defect:
-                            past_defects[subformula] = [subformula, TemporalFormula(subformula[2:]).negation().formula]
-            return past_defects
-
-        # Returns candidate clusters for the last cluster in the filtration
-        def get_top_clusters(clusters):
-            top_clusters = []
-            for c in clusters:
-                if future_defect(c) == {}:
-                    top_clusters.append(c)
-            return top_clusters
-
-        # Returns candidate clusters for the first cluster in the filtration
-        def get_bottom_clusters(clusters):
-            bottom_clusters = []
-            for c in clusters:
-                if past_defect(c) == {}:
-                     bottom_clusters.append(c)
-            return bottom_clusters
-
-        def formula_in_model(model):
-            for subset in model:
-                if isinstance(subset, list):
-                    for mcs in subset:
-                        if self.formula in mcs:
-                            return True
+    # Computes a model on the fly: starting from the clusters containing the formula, only the clusters and
+    # irreflexive sets needed to cure outstanding defects are generated. Clusters are tuples of bitmasks and
+    # irreflexive sets are bitmasks. Returns False if no model exists
+    def get_model_on_the_fly(self):
+        index = self.get_closure_index()
+        clauses = closure_clauses(TemporalFormula, index.members)
+        clusters = {}
+
+        # Yields the maximal consistent sets in a cube, generated by propagating the clauses inside it
+        def sets_in(cube):
+            return consistent_in(cube, len(index), clauses)
+
+        # Returns the cluster of a reflexive set
+        def cluster_of(mask):
+            if mask not in clusters:
+                cube = index.meet(index.successor_cube(mask), index.predecessor_cube(mask))
+                cluster = tuple(sets_in(cube))
+                for member in cluster:
+                    clusters[member] = cluster
+            return clusters[mask]
+
+        def members(element):
+            if isinstance(element, tuple):
+                return element
+            return (element,)
+
+        # Returns the (defect, cure) pairs of an element that are not cured within it
+        def defects(element, eventualities):
+            return [(defect, cure) for defect, cure in eventualities
+                    if any(holds(defect, m) for m in members(element))
+                    and not any(holds(cure, m) for m in members(element))]
+
+        # Checks defects have been passed up between consecutive elements a and b
+        def passed_up(a, b):
+            for defect, cure in defects(a, index.future):
+                if not any(holds(defect, m) or holds(cure, m) for m in members(b)):
+                    return False
+            for defect, cure in defects(b, index.past):
+                if not any(holds(defect, m) or holds(cure, m) for m in members(a)):
+                    return False
+            return True
+
+        # Yields the elements that can follow (forward) or precede an element in the model
+        def neighbours(element, forward):
+            if isinstance(element, tuple):
+                if forward:
+                    cube = index.cluster_successor_cube(element)
+                else:
+                    cube = index.cluster_predecessor_cube(element)
+                for mask in sets_in(cube):
+                    if not index.access(mask, mask):
+                        if (forward and passed_up(element, mask)) or (not forward and passed_up(mask, element)):
+                            yield mask
+            else:
+                if forward:
+                    cube = index.successor_cube(element)
+                else:
+                    cube = index.predecessor_cube(element)
+                seen = set()
+                for mask in sets_in(cube):
+                    if mask not in seen and index.access(mask, mask):
+                        cluster = cluster_of(mask)
+                        seen.update(cluster)
+                        if all(member & cube[0] == cube[1] for member in cluster):
+                            if forward and passed_up(element, cluster) or not forward and passed_up(cluster, element):
+                                yield cluster
+
+        # Elements from which no top (forward) or bottom (backward) cluster can be reached
+        explored = {True: set(), False: set()}
+
+        # Searches for a path from a cluster to a top cluster (forward) or a bottom cluster (backward)
+        def search(start, forward):
+            eventualities = index.future if forward else index.past
+            if defects(start, eventualities) == []:
+                return []
+            visited = set()
+            path = [start]
+            stack = [neighbours(start, forward)]
+            while stack:
+                element = next(stack[-1], None)
+                if element is None:
+                    visited.add(path.pop())
+                    stack.pop()
+                elif element not in visited and element not in explored[forward] and element not in path:
+                    path.append(element)
+                    if isinstance(element, tuple) and defects(element, eventualities) == []:
+                        return path[1:]
+                    stack.append(neighbours(element, forward))
+            # Loop check: nothing visited by a failed search can reach the end of the model
+            explored[forward].update(visited)
+            return None
+
+        def decode(element):
+            if isinstance(element, tuple):
+                return [index.decode(mask) for mask in element]
+            return index.decode(element)
+
+        # Iterates through the clusters containing the formula
+        formula_literal = index.literal(self.formula)
+        if formula_literal is None:
             return False
+        tried = set()
+        for mask in sets_in((1 << formula_literal[0], formula_literal[1] << formula_literal[0])):
+            if mask in tried or not index.access(mask, mask):
+                continue
+            cluster = cluster_of(mask)
+            tried.update(cluster)
+            future = search(cluster, True)
+            if future is None:
+                continue
+            past = search(cluster, False)
+            if past is None:
+                continue
+            return [decode(element) for element in list(reversed(past)) + [cluster] + future]
+        return False
 
-        # Computes next mcs in the model
-        def find_next_mcs(previous, list_of_irref_mcs):
+    # Combines models of atom-disjoint components into a model of the whole formula
+    def combine_models(self, components, models):
+        closure_set = self.get_closure_set()
+        conjunctions = self.get_conjuncts()[1]
+
+        # Restricts a union of component sets to the closure and adds the conjunctions joining the components
+        def merge(parts):
+            merged = set().union(*parts) & closure_set
+            for conjunction in reversed(conjunctions):
+                temp = TemporalFormula(conjunction)
+                if temp.left_subformula().formula in merged and temp.right_subformula().formula in merged:
+                    merged.add(conjunction)
+                else:
+                    merged.add(temp.negation().formula)
+            return merged
+
+        # Returns the cluster of the combined model in which every component sits in its current cluster
+        def product_cluster(positions):
+            cluster = [[]]
+            for model, position in zip(models, positions):
+                cluster = [mcs + [member] for mcs in cluster for member in model[position]]
+            return [merge(parts) for parts in cluster]
+
+        # Every component model is moved to a cluster containing its formula at the same time
+        targets = []
+        for component, model in zip(components, models):
+            for position in range(0, len(model), 2):
+                if any(component.formula in mcs for mcs in model[position]):
+                    targets.append(position)
+                    break
+
+        positions = [0] * len(models)
+        combined_model = [product_cluster(positions)]
+
+        # Passes the next irreflexive mcs of component k while the other components stay in their clusters
+        def advance(k):
+            parts = [model[position][0] for model, position in zip(models, positions)]
+            parts[k] = models[k][positions[k] + 1]
+            combined_model.append(merge(parts))
+            positions[k] += 2
+            combined_model.append(product_cluster(positions))
+
+        for k in range(len(models)):
+            while positions[k] < targets[k]:
+                advance(k)
+        for k in range(len(models)):
+            while positions[k] < len(models[k]) - 1:
+                advance(k)
+        return combined_model
+
+    # Decides the formula with the quick tests of prechecks.py: returns False if it is propositionally
+    # unsatisfiable, the model of a single cluster if a constant valuation satisfies it in a maximal consistent set,
+    # and None if neither applies
+    def precheck(self):
+        if propositionally_unsatisfiable(self):
+            self.tier = 'propositional'
+            return False
+        valuation = constant_valuation(self)
+        if valuation is not None:
+            mcs = constant_mcs(self, valuation)
+            if mcs is not None:
+                self.tier = 'constant'
+                return [[mcs]]
+        return None
+
+    # Computes the model; returns False if no model exists. Unless precheck is False, the quick tests of precheck
+    # are tried first. The filtration search tries candidates in the given ordering of ORDERINGS; with portfolio,
+    # the bottom clusters and orderings are searched concurrently and the first model found is returned.
+    # self.strategy records the search that found the model and self.tier the test that decided the formula
+    def get_model(self, parallel=False, engine='filtration', portfolio=False, processes=None, ordering='default',
+                  precheck=True):
+        return self.keeping_views(self.find_model, parallel, engine, portfolio, processes, ordering, precheck)
+
+    # Computes the model as get_model, with the lists of sets of strings kept
+    def find_model(self, parallel, engine, portfolio, processes, ordering, precheck):
+
+        if precheck:
+            self.search_stats = {'expanded': 0, 'backtracked': 0}
+            model = self.precheck()
+            if model is not None:
+                return model
+        self.tier = 'full'
+
+        # Checks the atom-disjoint components independently and combines their models
+        components = self.get_components()
+        if len(components) > 1:
+            models = []
+            self.search_stats = {'expanded': 0, 'backtracked': 0}
+            # The workers of a pool cannot start pools of their own, so a portfolio searches the components in turn
+            if parallel and not portfolio:
+                checkpoints = [None if self.checkpoint is None else self.checkpoint.component(k)
+                               for k in range(len(components))]
+                check = partial(component_model, engine=engine, ordering=ordering, precheck=precheck,
+                                pruning=self.pruning, memory_ceiling=self.memory_ceiling, resume=self.resuming)
+                with Pool(processes) as pool:
+                    for model, search_stats in pool.imap(check, zip([component.formula for component in components],
+                                                                    checkpoints)):
+                        for key in self.search_stats:
+                            self.search_stats[key] += search_stats[key]
+                        if model == False:
+                            return False
+                        models.append(model)
+            else:
+                for k, component in enumerate(components):
+                    if self.checkpoint is not None:
+                        component.use_checkpoint(self.checkpoint.component(k), self.resuming)
+                    model = component.get_model(engine=engine, portfolio=portfolio, processes=processes,
+                                                ordering=ordering, precheck=precheck)
+                    for key in self.search_stats:
+                        self.search_stats[key] += component.search_stats[key]
+                    if model == False:
+                        return False
+                    models.append(model)
+            return self.combine_models(components, models)
+
+        if engine == 'tableau':
+            return self.get_model_on_the_fly()
+        if engine == 'bdd':
+            return SymbolicEngine(self).get_model()
+
+        if portfolio:
+            return self.get_portfolio_model(processes)
+
+        # Under a memory ceiling, the search runs over rows rather than sets of strings
+        search = self if self.memory_ceiling is None else RowSearch(self)
+
+        # A checkpointed search of the same ordering, over the same elements, continues where it stopped
+        resumed = self.resumed
+        if resumed is not None and (resumed['stage'] not in ('search', 'done') or resumed['ordering'] != ordering
+                                    or resumed.get('rows', False) != (search is not self)):
+            resumed = None
+        if resumed is not None and resumed['stage'] == 'done':
+            self.strategy = resumed['strategy']
+            self.search_stats = resumed['stats']
+            return resumed['model']
 
-            def cured(cures, next_set):
-                if isinstance(next_set, set):
-                    next_set = [next_set]
-                for subset in next_set:
-                    if any(cure in subset for cure in cures):
+        # Iterates through all possible smallest clusters
+        self.search_stats = {'expanded': 0, 'backtracked': 0}
+        bottom_clusters = search.get_bottom_clusters(search.list_of_clusters())
+        start, state = 0, None
+        if resumed is not None:
+            start = resumed['bottom']
+            state = (resumed['model'], resumed['irref_candidates'], resumed['cluster_candidates'])
+            self.search_stats = resumed['stats']
+        model = False
+        for k in range(start, len(bottom_clusters)):
+            save = None
+            if self.checkpoint is not None:
+                save = partial(self.save_search, ordering, k, len(bottom_clusters))
+            model = search.compute_model(bottom_clusters[k], ordering, state if k == start else None, save)
+            if model != False:
+                self.strategy = (ordering, k)
+                break
+        if self.checkpoint is not None:
+            self.save_checkpoint('done', {'ordering': ordering, 'model': model, 'strategy': self.strategy,
+                                          'stats': self.search_stats}, "The search is complete.")
+        return model
+
+    # Checkpoints the search from the k-th of count bottom clusters if the interval has passed: the model built so
+    # far and the candidates not yet ruled out
+    def save_search(self, ordering, k, count, model, list_of_irref_mcs, list_of_clusters):
+        if self.checkpoint.due():
+            self.save_checkpoint('search', {'ordering': ordering, 'rows': self.memory_ceiling is not None,
+                                            'bottom': k, 'model': model,
+                                            'irref_candidates': list_of_irref_mcs,
+                                            'cluster_candidates': list_of_clusters,
+                                            'stats': dict(self.search_stats)},
+                                 f"Search: bottom cluster {k + 1} of {count}, depth {len(model)}, "
+                                 f"{self.search_stats['expanded']} nodes expanded.")
+
+    # Runs the filtration search once with each ordering; returns {ordering: (model, expanded nodes, backtracks)}
+    def compare_orderings(self):
+        results = {}
+        for ordering in ORDERINGS:
+            model = self.get_model(ordering=ordering, precheck=False)
+            results[ordering] = (model, self.search_stats['expanded'], self.search_stats['backtracked'])
+        return results
+
+    # Returns the searches of the portfolio as (ordering, index of the bottom cluster) pairs, so that every bottom
+    # cluster is tried with the default ordering before any is tried with another
+    def get_strategies(self):
+        bottom_clusters = self.get_bottom_clusters(self.list_of_clusters())
+        return [(ordering, k) for ordering in ORDERINGS for k in range(len(bottom_clusters))]
+
+    # Runs a single search of the portfolio
+    def run_strategy(self, strategy):
+        ordering, k = strategy
+        self.search_stats = {'expanded': 0, 'backtracked': 0}
+        return self.compute_model(self.get_bottom_clusters(self.list_of_clusters())[k], ordering)
+
+    # Runs the searches of the portfolio in worker processes, which map the tables of the formula from a temporary
+    # file. Returns the first model found; the remaining searches are cancelled when the pool is terminated
+    def get_portfolio_model(self, processes=None):
+        strategies = self.get_strategies()
+        if strategies == []:
+            return False
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'formula.tables')
+            self.export_tables(path)
+            with Pool(processes, initializer=load_portfolio, initargs=(self.formula, path)) as pool:
+                for strategy, model, search_stats in pool.imap_unordered(run_portfolio_strategy, strategies):
+                    if model != False:
+                        self.strategy = strategy
+                        self.search_stats = search_stats
+                        return model
+        return False
+
+    # Finds the future defects in a cluster: returns a dictionary {defect: cure} e.g. {Fm: [Fm, m]}
+    def future_defect(self, cluster):
+        future_defects = {}
+        if isinstance(cluster, set):
+            cluster = [cluster]
+        for mcs in cluster:
+            for subformula in mcs:
+                if subformula.startswith("F"):
+                    add_defect = True
+                    for s in cluster:
+                        if subformula[1:] in s:
+                            add_defect = False
+                            break
+                    if add_defect:
+                        future_defects[subformula] = [subformula, subformula[1:]]
+                elif subformula.startswith("~G"):
+                    add_defect = True
+                    for s in cluster:
+                        if TemporalFormula(subformula[2:]).negation().formula in s:
+                            add_defect = False
+                            break
+                    if add_defect:
+                        future_defects[subformula] = [subformula, TemporalFormula(subformula[2:]).negation().formula]
+        return future_defects
+
+    # Finds the past defects in a cluster: returns a dictionary {defect: cure} e.g. {Pm: [Pm, m]}
+    def past_defect(self, cluster):
+        past_defects = {}
+        if isinstance(cluster, set):
+            cluster = [cluster]
+        for mcs in cluster:
+            for subformula in mcs:
+                if subformula.startswith("P"):
+                    add_defect = True
+                    for s in cluster:
+                        if subformula[1:] in s:
+                            add_defect = False
+                            break
+                    if add_defect:
+                        past_defects[subformula] = [subformula, subformula[1:]]
+                elif subformula.startswith("~H"):
+                    add_defect = True
+                    for s in cluster:
+                        if TemporalFormula(subformula[2:]).negation().formula in s:
+                            add_defect = False
+                            break
+                    if add_defect:
+                        past_defects[subformula] = [subformula, TemporalFormula(subformula[2:]).negation().formula]
+        return past_defects
+
+    # Returns candidate clusters for the last cluster in the filtration
+    def get_top_clusters(self, clusters):
+        top_clusters = []
+        for c in clusters:
+            if self.future_defect(c) == {}:
+                top_clusters.append(c)
+        return top_clusters
+
+    # Returns candidate clusters for the first cluster in the filtration
+    def get_bottom_clusters(self, clusters):
+        bottom_clusters = []
+        for c in clusters:
+            if self.past_defect(c) == {}:
+                 bottom_clusters.append(c)
+        return bottom_clusters
+
+    def formula_in_model(self, model):
+        for subset in model:
+            if isinstance(subset, list):
+                for mcs in subset:
+                    if self.formula in mcs:
                         return True
-                return False
+        return False
 
-            def passed_up(defects, next_set):
-                for defect, cures in defects.items():
-                    if not cured(cures, next_set):
-                        return False
-                return True
+    # Returns how many of the given future defects of another element a cluster or an irreflexive set cures
+    def count_cured(self, defects, element):
+        element = [element] if isinstance(element, set) else element
+        return sum(any(cure in mcs for mcs in element for cure in cures) for cures in defects.values())
+
+    # Returns the number of maximal consistent sets after a cluster or an irreflexive set
+    def count_after(self, element):
+        mcs = element[0] if isinstance(element, list) else element
+        row = self.get_mcs_table().find(self.get_closure_index().encode(mcs))
+        return bin(self.get_access_matrix().row(row)).count('1')
+
+    # Computes next mcs in the model
+    def find_next_mcs(self, previous, list_of_irref_mcs, ordering='default'):
+
+        def cured(cures, next_set):
+            if isinstance(next_set, set):
+                next_set = [next_set]
+            for subset in next_set:
+                if any(cure in subset for cure in cures):
+                    return True
+            return False
 
-            if list_of_irref_mcs == []:
-                return None
-            else:
-                for irref in list_of_irref_mcs:
-                    if self.cluster_before_mcs(previous, irref):
-                        # Checks defects have been passed up
-                        if passed_up(future_defect(previous), irref) and passed_up(past_defect(irref), previous):
-                            return irref
-                return None
-
-        # Computes next cluster in the model
-        def find_next_cluster(previous, list_of_clusters):
-
-            def cured(cures, next_set):
-                for subset in next_set:
-                    if any(cure in subset for cure in cures):
-                        return True
-                return False
+        def passed_up(defects, next_set):
+            for defect, cures in defects.items():
+                if not cured(cures, next_set):
+                    return False
+            return True
 
-            def passed_up(defects, next_set):
-                for defect, cures in defects.items():
-                    if not cured(cures, next_set):
-                        return False
-                return True
+        if list_of_irref_mcs == []:
+            return None
+        else:
+            for irref in ORDERINGS[ordering](self, previous, list_of_irref_mcs):
+                if self.cluster_before_mcs(previous, irref):
+                    # Checks defects have been passed up
+                    if passed_up(self.future_defect(previous), irref) and passed_up(self.past_defect(irref), previous):
+                        return irref
+            return None
+
+    # Computes next cluster in the model
+    def find_next_cluster(self, previous, list_of_clusters, ordering='default'):
+
+        def cured(cures, next_set):
+            if isinstance(next_set, set):
+                next_set = [next_set]
+            for subset in next_set:
+                if any(cure in subset for cure in cures):
+                    return True
+            return False
 
-            if list_of_clusters == []:
-                return None
-            else:
-                for cluster in list_of_clusters:
-                    if self.mcs_before_cluster(previous, cluster):
-                        # Checks defects have been passed up
-                        if passed_up(future_defect(previous), cluster) and passed_up(past_defect(cluster), previous):
-                            return cluster
-                return None
-
-        # Computes a model for a given smallest cluster
-        def compute_model(bottom_cluster):
+        def passed_up(defects, next_set):
+            for defect, cures in defects.items():
+                if not cured(cures, next_set):
+                    return False
+            return True
+
+        if list_of_clusters == []:
+            return None
+        else:
+            for cluster in ORDERINGS[ordering](self, previous, list_of_clusters):
+                if self.mcs_before_cluster(previous, cluster):
+                    # Checks defects have been passed up
+                    if passed_up(self.future_defect(previous), cluster) and passed_up(self.past_defect(cluster), previous):
+                        return cluster
+            return None
+
+    # Computes a model for a given smallest cluster, trying the candidates for the next set in the given ordering.
+    # Adds the nodes it expands and the times it backtracks to self.search_stats. state continues a search from its
+    # (model, irreflexive candidates, cluster candidates), and save is called with them before every step
+    def compute_model(self, bottom_cluster, ordering='default', state=None, save=None):
+        if state is None:
             model = [bottom_cluster]
             list_of_irref_mcs = self.list_of_irref_mcs()
             list_of_clusters = self.list_of_clusters()
-            while True:
-                # print(model)
-                if model[-1] in get_top_clusters(self.list_of_clusters()) and formula_in_model(model):
-                    return model
-                else:
-                    if isinstance(model[-1], list):
-                        if list_of_irref_mcs == []:
-                            return False
-                        else:
-                            next_item = find_next_mcs(model[-1], list_of_irref_mcs)
-                            if next_item is None:
-                                if len(model) == 1:
-                                    return False
-                                else:
-                                    list_of_clusters.remove(model[-1])
-                                    model.pop()
+        else:
+            model, list_of_irref_mcs, list_of_clusters = state
+        stats = self.search_stats
+        while True:
+            if save is not None:
+                save(model, list_of_irref_mcs, list_of_clusters)
+            # print(model)
+            if model[-1] in self.get_top_clusters(self.list_of_clusters()) and self.formula_in_model(model):
+                return model
+            else:
+                if isinstance(model[-1], list):
+                    if list_of_irref_mcs == []:
+                        return False
+                    else:
+                        stats['expanded'] += 1
+                        next_item = self.find_next_mcs(model[-1], list_of_irref_mcs, ordering)
+                        if next_item is None:
+                            if len(model) == 1:
+                                return False
                             else:
-                                while next_item in model:
-                                    list_of_irref_mcs.remove(next_item)
-                                    next_item = find_next_mcs(model[-1], list_of_irref_mcs)
-                                model.append(next_item)
-                    elif isinstance(model[-1], set):
-                        if list_of_clusters == []:
-                            return False
-                        else:
-                            next_item = find_next_cluster(model[-1], list_of_clusters)
-                            if next_item is None:
-                                list_of_irref_mcs.remove(model[-1])
+                                list_of_clusters.remove(model[-1])
                                 model.pop()
-                            else:
-                                while next_item in model:
-                                    list_of_clusters.remove(next_item)
-                                    next_item = find_next_mcs(model[-1], list_of_clusters)
-                                model.append(next_item)
+                                stats['backtracked'] += 1
+                        else:
+                            while next_item in model:
+                                list_of_irref_mcs.remove(next_item)
+                                next_item = self.find_next_mcs(model[-1], list_of_irref_mcs, ordering)
+                            model.append(next_item)
+                elif isinstance(model[-1], set):
+                    if list_of_clusters == []:
+                        return False
+                    else:
+                        stats['expanded'] += 1
+                        next_item = self.find_next_cluster(model[-1], list_of_clusters, ordering)
+                        if next_item is None:
+                            list_of_irref_mcs.remove(model[-1])
+                            model.pop()
+                            stats['backtracked'] += 1
+                        else:
+                            while next_item in model:
+                                list_of_clusters.remove(next_item)
+                                next_item = self.find_next_mcs(model[-1], list_of_clusters, ordering)
+                            model.append(next_item)
+        return False
+
+    # Checks if next_set can follow previous in a model: previous passes its future defects up to next_set and
+    # next_set passes its past defects down to previous
+    def passes_up(self, previous, next_set):
+
+        def cured(cures, element):
+            if isinstance(element, set):
+                element = [element]
+            for subset in element:
+                if any(cure in subset for cure in cures):
+                    return True
             return False
 
-        # Iterates through all possible smallest clusters
-        for bottom_cluster in get_bottom_clusters(self.list_of_clusters()):
-            if compute_model(bottom_cluster) != False:
-                return compute_model(bottom_cluster)
-        return False
+        for cures in self.future_defect(previous).values():
+            if not cured(cures, next_set):
+                return False
+        for cures in self.past_defect(next_set).values():
+            if not cured(cures, previous):
+                return False
+        return True
+
+    # Yields the distinct filtration models one at a time, as lists like those returned by get_model. The clusters,
+    # irreflexive sets and the candidates following each of them are computed once and reused between models.
+    # Stops after limit models and skips models of more than max_length clusters and irreflexive sets
+    def iter_models(self, limit=None, max_length=None, ordering='default'):
+        if limit == 0 or max_length == 0:
+            return
+        clusters = self.list_of_clusters()
+        list_of_irref_mcs = self.list_of_irref_mcs()
+        top = [self.future_defect(cluster) == {} for cluster in clusters]
+        containing = [any(self.formula in mcs for mcs in cluster) for cluster in clusters]
+        following = {}
+
+        # Elements are (True, k) for clusters[k] and (False, k) for list_of_irref_mcs[k]; as the elements of a
+        # model are strictly ordered, a path never visits an element twice
+        def successors(element):
+            if element not in following:
+                is_cluster, k = element
+                if is_cluster:
+                    previous = clusters[k]
+                    candidates = {id(irref): (False, j) for j, irref in enumerate(list_of_irref_mcs)
+                                  if self.cluster_before_mcs(previous, irref) and self.passes_up(previous, irref)}
+                    ordered = [irref for irref in list_of_irref_mcs if id(irref) in candidates]
+                else:
+                    previous = list_of_irref_mcs[k]
+                    candidates = {id(cluster): (True, j) for j, cluster in enumerate(clusters)
+                                  if self.mcs_before_cluster(previous, cluster) and self.passes_up(previous, cluster)}
+                    ordered = [cluster for cluster in clusters if id(cluster) in candidates]
+                following[element] = [candidates[id(candidate)]
+                                      for candidate in ORDERINGS[ordering](self, previous, ordered)]
+            return following[element]
+
+        # The sets of a model are copies, so that changing a model does not change the ones after it
+        def decode(path):
+            return [[set(mcs) for mcs in clusters[k]] if is_cluster else set(list_of_irref_mcs[k])
+                    for is_cluster, k in path]
+
+        count = 0
+        for k, cluster in enumerate(clusters):
+            if self.past_defect(cluster) != {}:
+                continue
+            path = [(True, k)]
+            # witnessed[i] records whether the formula is in a cluster among the first i+1 elements of the path
+            witnessed = [containing[k]]
+            pending = [iter(successors(path[0]))] if max_length is None or max_length > 1 else [iter(())]
+            if top[k] and containing[k]:
+                yield decode(path)
+                count += 1
+                if count == limit:
+                    return
+            while pending:
+                element = next(pending[-1], None)
+                if element is None:
+                    pending.pop()
+                    path.pop()
+                    witnessed.pop()
+                    continue
+                is_cluster, j = element
+                path.append(element)
+                witnessed.append(witnessed[-1] or (is_cluster and containing[j]))
+                if is_cluster and top[j] and witnessed[-1]:
+                    yield decode(path)
+                    count += 1
+                    if count == limit:
+                        return
+                if max_length is None or len(path) < max_length:
+                    pending.append(iter(successors(element)))
+                else:
+                    path.pop()
+                    witnessed.pop()
+
+# The formula searched by a worker process of a portfolio
+portfolio_formula = None
+
+# Initialises a worker process of a portfolio with the tables of the formula
+def load_portfolio(formula_string, path):
+    global portfolio_formula
+    portfolio_formula = TemporalFormula(formula_string)
+    portfolio_formula.import_tables(path)
+    # The worker only runs searches of the portfolio, so it keeps the lists of sets of strings between them
+    portfolio_formula.views = {}
+
+# Runs a search of a portfolio in a worker process; returns the strategy with its model and search statistics
+def run_portfolio_strategy(strategy):
+    model = portfolio_formula.run_strategy(strategy)
+    return strategy, model, portfolio_formula.search_stats
+
+# Returns a model as a line of JSON: a list of {"cluster": [mcs, ...]} and {"mcs": mcs} objects, with each maximal
+# consistent set given as a sorted list of formula strings
+def model_to_json(model):
+    elements = []
+    for element in model:
+        if isinstance(element, list):
+            elements.append({'cluster': [sorted(mcs) for mcs in element]})
+        else:
+            elements.append({'mcs': sorted(element)})
+    return json.dumps(elements)
+
+# Computes the model of a single component, given with its checkpoint, under the options of the formula it was split
+# from; used by the worker processes of get_model. Returns the model and the search statistics
+def component_model(task, engine='filtration', ordering='default', precheck=True, pruning=True, memory_ceiling=None,
+                    resume=False):
+    formula_string, checkpoint = task
+    component = TemporalFormula(formula_string)
+    component.pruning = pruning
+    component.memory_ceiling = memory_ceiling
+    if checkpoint is not None:
+        component.use_checkpoint(checkpoint, resume)
+    model = component.get_model(engine=engine, ordering=ordering, precheck=precheck)
+    return model, component.search_stats
 
 # Main program
 def main():
+    parser = argparse.ArgumentParser(description="Checks a Priorean temporal formula over the real line.")
+    parser.add_argument('--engine', choices=['filtration', 'tableau', 'bdd'], default='filtration',
+                        help="filtration enumerates every maximal consistent set first; "
+                             "tableau builds the model on the fly; "
+                             "bdd represents the sets and the access relation symbolically")
+    parser.add_argument('--ordering', choices=list(ORDERINGS), default='default',
+                        help="order in which the filtration search tries the candidates for the next set")
+    parser.add_argument('--compare-orderings', action='store_true',
+                        help="run the filtration search with every ordering and report the nodes each expands")
+    parser.add_argument('--portfolio', action='store_true',
+                        help="search from every bottom cluster and ordering concurrently (filtration engine)")
+    parser.add_argument('--processes', type=int, metavar='N',
+                        help="number of worker processes of the portfolio (default: one per CPU)")
+    parser.add_argument('--models', type=int, metavar='N',
+                        help="enumerate up to N distinct filtration models instead of one (0 for all of them)")
+    parser.add_argument('--max-length', type=int, metavar='L',
+                        help="only enumerate models of at most L clusters and irreflexive sets")
+    parser.add_argument('--json', metavar='FILE',
+                        help="write each model to FILE as a line of JSON as soon as it is found")
+    parser.add_argument('--monitor', metavar='FILE',
+                        help="monitor the events in FILE, one JSON object such as {\"t\": 0.5, \"p\": true} per "
+                             "line, against the formula; - reads them from the lines after the formula")
+    parser.add_argument('--simplify', action='store_true',
+                        help="rewrite the formula into an equivalent one with a smaller closure first")
+    parser.add_argument('--no-prune', action='store_true',
+                        help="keep the maximal consistent sets that are unreachable from the formula")
+    parser.add_argument('--memory-ceiling', type=float, metavar='MB',
+                        help="keep at most MB megabytes of maximal consistent sets in memory, spilling the rest to "
+                             "sorted files in the temporary directory")
+    parser.add_argument('--estimate', action='store_true',
+                        help="print the estimated cost of checking the formula and its admission decision instead")
+    parser.add_argument('--calibration', metavar='FILE',
+                        help="estimate costs with the calibration in FILE, written by cost.py")
+    parser.add_argument('--no-precheck', action='store_true',
+                        help="skip the quick propositional and constant valuation tests before the full check")
+    parser.add_argument('--checkpoint', metavar='FILE',
+                        help="save the progress of the filtration check to FILE at intervals")
+    parser.add_argument('--checkpoint-interval', type=float, default=60.0, metavar='SECONDS',
+                        help="seconds between checkpoints (default: 60)")
+    parser.add_argument('--resume', action='store_true',
+                        help="continue the check from the checkpoint in the --checkpoint FILE")
+    parser.add_argument('--load-tables', metavar='FILE',
+                        help="map the precomputed tables of the formula from FILE instead of computing them")
+    parser.add_argument('--save-tables', metavar='FILE',
+                        help="write the precomputed tables of the formula to FILE")
+    args = parser.parse_args()
+    if args.resume and not args.checkpoint:
+        parser.error("--resume needs --checkpoint FILE")
+    if args.checkpoint and (args.engine != 'filtration' or args.portfolio or args.monitor or args.compare_orderings
+                            or args.models is not None):
+        parser.error("--checkpoint only applies to the search for a single model with the filtration engine")
     try:
         formula = TemporalFormula(input('Enter a temporal formula:'))
         print("The formula is formulated correctly.")
+        original = formula
+        if args.simplify:
+            formula = formula.simplify()
+            print(f"The formula simplifies to {formula.formula}; the closure shrank from "
+                  f"{len(original.get_closure_set())} to {len(formula.get_closure_set())} formulas.")
+        if args.estimate:
+            estimate = formula.estimate_cost(read_calibration(args.calibration) if args.calibration else None)
+            print(f"The closure has {estimate['closure_size']} formulas, {estimate['members']} of them "
+                  f"non-negated, and the formula has {estimate['temporal_operators']} temporal operators: "
+                  f"{estimate['choice_sets']} choice sets and at most {estimate['mcs_bound']} maximal consistent "
+                  f"sets.")
+            for engine in estimate['runtime']:
+                print(f"The {engine} engine should take {estimate['runtime'][engine]:.3g} seconds and "
+                      f"{estimate['memory'][engine] / 2 ** 20:.3g} MiB.")
+            print(f"The admission decision for the {args.engine} engine is {admit(estimate, args.engine)}.")
+            return
+        formula.pruning = not args.no_prune and not args.monitor
+        if args.memory_ceiling is not None:
+            formula.memory_ceiling = int(args.memory_ceiling * 2 ** 20)
+        if args.checkpoint:
+            formula.use_checkpoint(Checkpoint(args.checkpoint, args.checkpoint_interval, print), args.resume)
+        if args.load_tables:
+            formula.import_tables(args.load_tables)
+            if args.monitor and formula.pruned:
+                print("The tables were pruned, but the monitor needs every maximal consistent set; export them with "
+                      "--no-prune.")
+                return
+        if args.save_tables:
+            formula.export_tables(args.save_tables)
+        if args.monitor:
+            monitor = Monitor(formula)
+            verdict = monitor.verdict()
+            events = sys.stdin if args.monitor == '-' else open(args.monitor)
+            try:
+                for time_point, next_verdict in monitor.run(read_events(events)):
+                    if next_verdict != verdict:
+                        print(f"At time {time_point} the formula is {next_verdict}.")
+                        verdict = next_verdict
+            finally:
+                if events is not sys.stdin:
+                    events.close()
+            print(f"After {monitor.events} events the formula is {verdict}; "
+                  f"{len(monitor.compatible())} maximal consistent sets remain compatible.")
+            return
         print(f"The closure set is {formula.get_closure_set()}.")
-        print(f"The choice sets are {formula.get_choice_set()}.")
-        print(f"The maximal consistent sets are {formula.get_mc_set()}.")
-        print(f"The clusters are {formula.list_of_clusters()}.")
-        print(f"The irreflexive maximal consistent sets are {formula.list_of_irref_mcs()}.")
-        if formula.get_model() == False:
+        model = None
+        if not args.no_precheck and args.models is None and not args.compare_orderings:
+            model = formula.precheck()
+        if model is None and args.engine == 'filtration':
+            # Under a memory ceiling, only the sizes of the tables are printed
+            if formula.memory_ceiling is None:
+                print(f"The choice sets are {formula.get_choice_set()}.")
+                print(f"The maximal consistent sets are {formula.get_mc_set()}.")
+            else:
+                print(f"There are {len(formula.get_mcs_table())} maximal consistent sets.")
+            if formula.pruned:
+                print(f"{formula.pruned} maximal consistent sets unreachable from the formula were pruned.")
+            if formula.memory_ceiling is None:
+                print(f"The clusters are {formula.list_of_clusters()}.")
+                print(f"The irreflexive maximal consistent sets are {formula.list_of_irref_mcs()}.")
+            else:
+                print(f"There are {len(formula.get_cluster_table())} clusters and {len(formula.irref_rows)} "
+                      f"irreflexive maximal consistent sets.")
+        if args.models is not None:
+            found = 0
+            output = open(args.json, 'w') if args.json else None
+            try:
+                for model in formula.iter_models(limit=args.models or None, max_length=args.max_length):
+                    # Models of the simplified formula whose points cannot keep irreflexive sets are skipped
+                    if args.simplify:
+                        model = map_model(original, model)
+                        if model is None:
+                            continue
+                    found += 1
+                    print(f"Model {found}: {model}.")
+                    if output is not None:
+                        output.write(model_to_json(model) + '\n')
+                        output.flush()
+            finally:
+                if output is not None:
+                    output.close()
+            if found == 0:
+                print("No model found.")
+            return
+        if args.compare_orderings:
+            for ordering, (model, expanded, backtracked) in formula.compare_orderings().items():
+                result = "no model" if model == False else f"a model of {len(model)} sets and clusters"
+                print(f"{ordering}: {result}, {expanded} nodes expanded, {backtracked} backtracks.")
+            return
+        if model is None:
+            model = formula.get_model(engine=args.engine, portfolio=args.portfolio, processes=args.processes,
+                                      ordering=args.ordering, precheck=False)
+        if args.simplify and model != False:
+            model = map_model(original, model)
+            # Without a filtration form for the mapped model, the original formula is searched instead
+            if model is None:
+                model = original.get_model(engine=args.engine, portfolio=args.portfolio, processes=args.processes,
+                                           ordering=args.ordering, precheck=False)
+        if args.json:
+            with open(args.json, 'w') as output:
+                if model != False:
+                    output.write(model_to_json(model) + '\n')
+        if model == False:
             result = "No model found."
         else:
-            result = f"A possible model is {formula.get_model()}."
+            result = f"A possible model is {model}."
         print(result)
+        print(f"The formula was decided by the {TIERS[formula.tier]}.")
+        if args.portfolio and formula.strategy is not None:
+            ordering, k = formula.strategy
+            print(f"The model was found with the {ordering} ordering from bottom cluster {k}.")
+        if args.engine == 'filtration' and formula.tier == 'full' and (model != False or not args.portfolio):
+            print(f"The search expanded {formula.search_stats['expanded']} nodes and backtracked "
+                  f"{formula.search_stats['backtracked']} times.")
 
     except ParseError:
         print("Incorrectly formulated temporal formula.")
     except Exception as e:
         print("An error occurred.")
 
-start_time = time.time()
-main()
-end_time = time.time()
+if __name__ == '__main__':
+    start_time = time.time()
+    main()
+    end_time = time.time()
 
-elapsed_time = end_time - start_time
-print(f"Elapsed time: {elapsed_time:.6f} seconds")
+    elapsed_time = end_time - start_time
+    print(f"Elapsed time: {elapsed_time:.6f} seconds")
 
 
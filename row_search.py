@@ -0,0 +1,155 @@
+from mcs_tables import holds
+from orderings import ORDERINGS
+
+# Filtration search of real-time.py over row indices, for tables kept under a memory ceiling.
+# TemporalFormula.compute_model works on lists of sets of strings, which take far more memory than the mcs table
+# itself. Here irreflexive sets are rows of the mcs table and clusters are tuples of rows taken from the ranges of
+# the cluster table, as in the tableau engine; access is decided by the successor cubes of their masks, so neither
+# the access matrix nor any set of strings is built. The candidates are sorted and tried in the same order as by
+# compute_model, so both searches expand the same nodes and find the same model, which is decoded at the end.
+
+
+class RowSearch:
+
+    def __init__(self, formula):
+        self.formula = formula
+        self.mcs_table = formula.get_mcs_table()
+        self.cluster_table = formula.get_cluster_table()
+        self.index = self.mcs_table.index
+        self.formula_literal = self.index.literal(formula.formula)
+        self.counts = {}
+        self.clusters = None
+        self.irref = None
+
+    # Returns the masks of the sets of an element
+    def masks(self, element):
+        if isinstance(element, tuple):
+            return [self.mcs_table[row] for row in element]
+        return [self.mcs_table[element]]
+
+    # Returns the cube of the sets after every set of an element, or None if there are none
+    def successor_cube(self, element):
+        return self.index.cluster_successor_cube(self.masks(element))
+
+    # Checks if a<b for every set a of the first element and every set b of the second
+    def precedes(self, first, second):
+        cube = self.successor_cube(first)
+        return cube is not None and all(mask & cube[0] == cube[1] for mask in self.masks(second))
+
+    # Returns the elements sorted as list_of_clusters and list_of_irref_mcs sort them: by the elements each one
+    # precedes, compared in the order of the elements. The flags are packed into an integer, first one highest
+    def sort(self, elements):
+        keys = {}
+        for first in elements:
+            cube = self.successor_cube(first)
+            key = 0
+            if cube is not None:
+                for second in elements:
+                    key = key << 1 | all(mask & cube[0] == cube[1] for mask in self.masks(second))
+            keys[first] = key
+        return sorted(elements, key=keys.get, reverse=True)
+
+    # Returns a list of all clusters as tuples of rows, sorted as TemporalFormula.list_of_clusters; the sorted list
+    # is kept while the search lasts
+    def list_of_clusters(self):
+        if self.clusters is None:
+            self.clusters = self.sort([tuple(self.cluster_table[k]) for k in range(len(self.cluster_table))])
+        return list(self.clusters)
+
+    # Returns a list of the irreflexive rows, sorted as TemporalFormula.list_of_irref_mcs
+    def list_of_irref_mcs(self):
+        if self.irref is None:
+            self.irref = self.sort(list(self.formula.irref_rows))
+        return list(self.irref)
+
+    # Returns the (defect, cure) pairs of an element that are not cured within it, as TemporalFormula.future_defect
+    # and past_defect find them
+    def defects(self, element, eventualities):
+        masks = self.masks(element)
+        return [(defect, cure) for defect, cure in eventualities
+                if any(holds(defect, mask) for mask in masks) and not any(holds(cure, mask) for mask in masks)]
+
+    # Returns the future defects of an element, for the orderings
+    def future_defect(self, element):
+        return self.defects(element, self.index.future)
+
+    # Returns how many of the given defects an element cures, with the defect itself or its cure
+    def count_cured(self, defects, element):
+        masks = self.masks(element)
+        return sum(any(holds(defect, mask) or holds(cure, mask) for mask in masks) for defect, cure in defects)
+
+    # Checks defects have been passed up between consecutive elements
+    def passed_up(self, previous, next_element):
+        future = self.future_defect(previous)
+        past = self.defects(next_element, self.index.past)
+        return self.count_cured(future, next_element) == len(future) and self.count_cured(past, previous) == len(past)
+
+    # Returns the number of maximal consistent sets after an element
+    def count_after(self, element):
+        row = element[0] if isinstance(element, tuple) else element
+        if row not in self.counts:
+            cube = self.index.successor_cube(self.mcs_table[row])
+            self.counts[row] = 0 if cube is None else sum(1 for mask in self.mcs_table if mask & cube[0] == cube[1])
+        return self.counts[row]
+
+    # Returns candidate clusters for the first cluster in the filtration
+    def get_bottom_clusters(self, clusters):
+        return [cluster for cluster in clusters if self.defects(cluster, self.index.past) == []]
+
+    def formula_in_model(self, model):
+        return any(holds(self.formula_literal, mask)
+                   for element in model if isinstance(element, tuple) for mask in self.masks(element))
+
+    # Returns the first candidate that can follow the previous element, trying them in the given ordering
+    def find_next(self, previous, candidates, ordering):
+        for candidate in ORDERINGS[ordering](self, previous, candidates):
+            if self.precedes(previous, candidate) and self.passed_up(previous, candidate):
+                return candidate
+        return None
+
+    # Returns a model in the form of TemporalFormula.get_model
+    def decode(self, model):
+        decode = self.index.decode
+        return [[decode(mask) for mask in self.masks(element)] if isinstance(element, tuple)
+                else decode(self.mcs_table[element]) for element in model]
+
+    # Computes a model for a given smallest cluster as TemporalFormula.compute_model does, with the same state and
+    # save; returns the decoded model, or False if no model exists
+    def compute_model(self, bottom_cluster, ordering='default', state=None, save=None):
+        if state is None:
+            model = [bottom_cluster]
+            list_of_irref_mcs = self.list_of_irref_mcs()
+            list_of_clusters = self.list_of_clusters()
+        else:
+            model, list_of_irref_mcs, list_of_clusters = state
+        stats = self.formula.search_stats
+        while True:
+            if save is not None:
+                save(model, list_of_irref_mcs, list_of_clusters)
+            last = model[-1]
+            if isinstance(last, tuple):
+                if self.defects(last, self.index.future) == [] and self.formula_in_model(model):
+                    return self.decode(model)
+                if list_of_irref_mcs == []:
+                    return False
+                stats['expanded'] += 1
+                next_item = self.find_next(last, list_of_irref_mcs, ordering)
+                if next_item is None:
+                    if len(model) == 1:
+                        return False
+                    list_of_clusters.remove(last)
+                    model.pop()
+                    stats['backtracked'] += 1
+                else:
+                    model.append(next_item)
+            else:
+                if list_of_clusters == []:
+                    return False
+                stats['expanded'] += 1
+                next_item = self.find_next(last, list_of_clusters, ordering)
+                if next_item is None:
+                    list_of_irref_mcs.remove(last)
+                    model.pop()
+                    stats['backtracked'] += 1
+                else:
+                    model.append(next_item)
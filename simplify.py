@@ -0,0 +1,192 @@
+from mcs_tables import negate
+
+# Simplification shared by real-time.py and minkowski-spacetime.py.
+# A formula is rewritten bottom-up over the subformulas recorded by TemporalFormula.parse, under equivalences valid
+# for the flow of time. For every flow, conjunctions and disjunctions are flattened, their repeated operands dropped
+# and the rest rebuilt nested to the right, so that the same operands under different bracketings give the same
+# formula.
+# On the real line, double negations are also removed. The real line is also dense and unbounded in both directions, so
+# FFA, GGA, PPA and HHA reduce to FA, GA, PA and HA; GHA and HGA say that A holds everywhere, and FPA and PFA that it
+# holds somewhere, so these formulas are eternal and any further F, P, G or H in front of them can be dropped. These
+# equivalences hold in Minkowski spacetime too, but the check of minkowski-spacetime.py is not invariant under them (it
+# rejects FFp and accepts Fp), nor under double negation (it accepts G(~~p>~Hp) and rejects G(p>~Hp)), so its rule set
+# leaves negations and temporal operators alone.
+
+
+# Formulas starting with these prefixes have the same truth value at every point
+ETERNAL = ('GH', 'FP')
+
+
+# Returns the simplified formula string of a unary operator applied to a simplified formula string; negations
+# enables the removal of double negations and temporal the rules for temporal operators
+def apply_operator(operator, formula_string, temporal=True, negations=True):
+    if operator == '~':
+        return negate(formula_string) if negations else operator + formula_string
+    if not temporal:
+        return operator + formula_string
+    if formula_string[:2] in ETERNAL or formula_string[0] == operator:
+        return formula_string
+    if operator + formula_string[0] in ('HG', 'PF'):
+        return formula_string[0] + operator + formula_string[1:]
+    return operator + formula_string
+
+
+# On a linear flow, (PA|(A|FA)) says that A holds somewhere
+def sometime_rule(connective, operands):
+    if connective != '|':
+        return operands
+    for operand in operands:
+        past, future = apply_operator('P', operand), apply_operator('F', operand)
+        if past != operand and future != operand and past in operands and future in operands:
+            sometime = apply_operator('F', past)
+            position = min(operands.index(past), operands.index(operand), operands.index(future))
+            rest = [other for other in operands if other not in (past, operand, future)]
+            return sometime_rule(connective, rest[:position] + [sometime] + rest[position:])
+    return operands
+
+
+# On a linear flow, (HA&(A&GA)) says that A holds everywhere
+def always_rule(connective, operands):
+    if connective != '&':
+        return operands
+    for operand in operands:
+        past, future = apply_operator('H', operand), apply_operator('G', operand)
+        if past != operand and future != operand and past in operands and future in operands:
+            always = apply_operator('G', past)
+            position = min(operands.index(past), operands.index(operand), operands.index(future))
+            rest = [other for other in operands if other not in (past, operand, future)]
+            return always_rule(connective, rest[:position] + [always] + rest[position:])
+    return operands
+
+
+# For each flow: whether double negations are removed, whether the rules for temporal operators apply, and the
+# rules on the operands of flattened conjunctions and disjunctions
+RULE_SETS = {
+    'real-line': (True, True, [sometime_rule, always_rule]),
+    'minkowski': (False, False, []),
+}
+
+
+# Returns the simplified formula string of a binary connective applied to simplified formula strings. operands
+# maps the simplified conjunctions and disjunctions built so far to their connective and flattened operands
+def combine(connective, left, right, rules, operands):
+    if connective == '>':
+        return '(' + left + '>' + right + ')'
+    parts = []
+    for side in (left, right):
+        if side in operands and operands[side][0] == connective:
+            parts.extend(operands[side][1])
+        else:
+            parts.append(side)
+    for rule in rules:
+        parts = rule(connective, parts)
+    unique = []
+    for part in parts:
+        if part not in unique:
+            unique.append(part)
+    if len(unique) == 1:
+        return unique[0]
+    result = unique[-1]
+    for part in reversed(unique[:-1]):
+        result = '(' + part + connective + result + ')'
+    operands[result] = (connective, unique)
+    return result
+
+
+# Returns an equivalent formula string for the given flow ('real-line' or 'minkowski'), rewritten bottom-up
+def simplify_formula(formula, flow):
+    text = formula.formula
+    negations, temporal, rules = RULE_SETS[flow]
+    operands = {}
+    stack = []
+    for start, end, connective in formula.subformulas:
+        if connective != -1:
+            right = stack.pop()
+            left = stack.pop()
+            stack.append(combine(text[connective], left, right, rules, operands))
+        elif end - start == 1:
+            stack.append(text[start])
+        else:
+            stack.append(apply_operator(text[start], stack.pop(), temporal, negations))
+    return stack[-1]
+
+
+# Returns the truth values of a temporal formula at every member of every element of a real-line model, from those
+# of its argument. A cluster stands for an interval in which each of its members recurs densely, and an irreflexive
+# set for a single point
+def temporal_values(operator, values, clustered):
+    summary, neutral = (any, False) if operator in 'FP' else (all, True)
+    inner = [summary(element) for element in values]
+    # outside[i] summarises the elements after element i for F and G, and those before it for P and H
+    outside = [neutral] * len(values)
+    accumulated = neutral
+    for i in (reversed(range(len(values))) if operator in 'FG' else range(len(values))):
+        outside[i] = accumulated
+        accumulated = summary((accumulated, inner[i]))
+    result = []
+    for i, element in enumerate(values):
+        value = summary((outside[i], inner[i])) if clustered[i] else outside[i]
+        result.append([value] * len(element))
+    return result
+
+
+# Rebuilds the filtration form of a mapped real-line model. A point of the model may get a set of the original closure
+# that accesses itself, which cannot stand as an irreflexive set; it is merged with the clusters on both sides when it
+# and their members all access each other, as the interval they span is then a cluster. Returns None if some such
+# point cannot be merged on both sides
+def rebuild_clusters(model, index):
+    rebuilt = [model[0]]
+    i = 1
+    while i < len(model):
+        mcs, cluster = model[i], model[i + 1]
+        mask = index.encode(mcs)
+        if not index.access(mask, mask):
+            rebuilt.extend([mcs, cluster])
+        elif all(index.access(mask, index.encode(member)) and index.access(index.encode(member), mask)
+                 for member in rebuilt[-1] + cluster):
+            for member in [mcs] + cluster:
+                if member not in rebuilt[-1]:
+                    rebuilt[-1].append(member)
+        else:
+            return None
+        i += 2
+    return rebuilt
+
+
+# Maps a real-line model of a simplified formula back to the closure of the original formula, by evaluating the
+# subformulas of the original at every point of the model. Returns the model in the form of get_model, or None if
+# the mapped model has no filtration form, as rebuild_clusters
+def map_model(formula, model):
+    text = formula.formula
+    elements = [element if isinstance(element, list) else [element] for element in model]
+    clustered = [isinstance(element, list) for element in model]
+    truth = {}
+    for start, end, connective in formula.subformulas:
+        subformula = text[start:end]
+        if subformula in truth:
+            continue
+        if connective != -1:
+            left, right = truth[text[start + 1:connective]], truth[text[connective + 1:end - 1]]
+            if text[connective] == '&':
+                values = [[l and r for l, r in zip(ls, rs)] for ls, rs in zip(left, right)]
+            elif text[connective] == '|':
+                values = [[l or r for l, r in zip(ls, rs)] for ls, rs in zip(left, right)]
+            else:
+                values = [[not l or r for l, r in zip(ls, rs)] for ls, rs in zip(left, right)]
+        elif end - start == 1:
+            values = [[subformula in mcs for mcs in element] for element in elements]
+        elif text[start] == '~':
+            values = [[not value for value in element] for element in truth[text[start + 1:end]]]
+        else:
+            values = temporal_values(text[start], truth[text[start + 1:end]], clustered)
+        truth[subformula] = values
+
+    mapped_model = []
+    for i, element in enumerate(elements):
+        members = []
+        for j in range(len(element)):
+            mcs = {subformula if values[i][j] else negate(subformula) for subformula, values in truth.items()}
+            if mcs not in members:
+                members.append(mcs)
+        mapped_model.append(members if clustered[i] else members[0])
+    return rebuild_clusters(mapped_model, formula.get_closure_index())
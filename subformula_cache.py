@@ -0,0 +1,296 @@
+from array import array
+from collections import OrderedDict
+
+# Process-wide cache shared by real-time.py and minkowski-spacetime.py.
+# Formulas checked in one process often share large subformulas, and everything derived from a subformula alone
+# (its parse, closure set, expansion, the consistency constraints of its literals and the consistent assignments of
+# its closure) is the same wherever it occurs. These artefacts are kept in a least recently used cache keyed by
+# (kind, subformula), bounded by a total weight; the weight of an entry is 1 plus the number of items it stores.
+# Cached values are shared, so they are tuples, frozensets and arrays that callers must not modify.
+
+
+class SubformulaCache:
+
+    def __init__(self, max_weight=1000000):
+        self.max_weight = max_weight
+        self.weight = 0
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    # Returns the cached value of a key, or None
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return entry[0]
+
+    # Caches a value, evicting the least recently used entries beyond the maximum weight. A value heavier than the
+    # maximum weight on its own is not cached, as it would evict everything else and still exceed the bound
+    def put(self, key, value, weight=1):
+        if key in self.entries:
+            self.weight -= self.entries.pop(key)[1]
+        if weight > self.max_weight:
+            return
+        self.entries[key] = (value, weight)
+        self.weight += weight
+        while self.weight > self.max_weight:
+            self.weight -= self.entries.popitem(last=False)[1][1]
+
+    def clear(self):
+        self.entries.clear()
+        self.weight = 0
+        self.hits = 0
+        self.misses = 0
+
+
+CACHE = SubformulaCache()
+
+
+# Returns the expansion of a formula string, as TemporalFormula.expand
+def expansion(formula_class, formula_string):
+    key = ('expansion', formula_string)
+    expanded = CACHE.get(key)
+    if expanded is None:
+        expanded = formula_class(formula_string).expand().formula
+        CACHE.put(key, expanded)
+    return expanded
+
+
+# Returns the constraints that TemporalFormula.is_consistent puts on choice sets containing a literal, as clauses:
+# tuples of (formula string, contained) conditions, at least one of which must hold. The literal itself is the
+# first condition of every clause, negated, so the clauses hold for every choice set
+def constraints(formula_class, literal):
+    key = ('constraints', literal)
+    clauses = CACHE.get(key)
+    if clauses is None:
+        formula = formula_class(expansion(formula_class, literal))
+        string = formula.formula
+        excluded = ["~HF" + string, "~GP" + string]
+        for operator, dual in (("F", "G~"), ("P", "H~"), ("G", "F~"), ("H", "P~")):
+            if string.startswith(operator):
+                excluded.append(dual + string[1:])
+        for operator, dual in (("~F", "~G~"), ("~P", "~H~"), ("~G", "~F~"), ("~H", "~P~")):
+            if string.startswith(operator):
+                excluded.append(dual + string[2:])
+        clauses = [((literal, False), (subformula, False)) for subformula in excluded]
+        if formula.conjunction() is not None:
+            left = formula.left_subformula().formula
+            right = formula.right_subformula().formula
+            if formula.conjunction() == "|":
+                clauses.append(((literal, False), (left, True), (right, True)))
+            elif formula.conjunction() == "&":
+                clauses.append(((literal, False), (left, True)))
+                clauses.append(((literal, False), (right, True)))
+            elif formula.conjunction() == ">":
+                clauses.append(((literal, False), (left, False), (right, True)))
+        clauses = tuple(clauses)
+        CACHE.put(key, clauses, 1 + len(clauses))
+    return clauses
+
+
+# Returns the closure set of a parsed formula, as TemporalFormula.get_closure_set
+def closure(formula):
+    key = ('closure', formula.formula)
+    closure_set = CACHE.get(key)
+    if closure_set is None:
+        closure_set = set()
+        for start, end, connective in formula.subformulas:
+            subformula = formula.formula[start:end]
+            closure_set.add(subformula)
+            if subformula[0] == '~':
+                closure_set.add(subformula[1:])
+            else:
+                closure_set.add('~' + subformula)
+        closure_set = frozenset(closure_set)
+        CACHE.put(key, closure_set, 1 + len(closure_set))
+    return closure_set
+
+
+# Compiles clauses over the members of a closure into (ones, zeros) bitmask pairs: a mask satisfies a clause iff
+# it has a bit of ones set or a bit of zeros clear. Conditions on formulas outside the closure are constant: a
+# formula outside the closure is in no choice set
+def compile_clauses(clauses, bits):
+    compiled = []
+    for clause in clauses:
+        ones = zeros = 0
+        for subformula, contained in clause:
+            if subformula in bits:
+                bit, value = bits[subformula], 1
+            elif subformula.startswith('~') and subformula[1:] in bits:
+                bit, value = bits[subformula[1:]], 0
+            elif contained:
+                continue
+            else:
+                break
+            if value == contained:
+                ones |= 1 << bit
+            else:
+                zeros |= 1 << bit
+        else:
+            compiled.append((ones, zeros))
+    return compiled
+
+
+# Returns the compiled clauses of every literal of a closure with the given non-negated members
+def closure_clauses(formula_class, members):
+    bits = {subformula: bit for bit, subformula in enumerate(members)}
+    clauses = []
+    for member in members:
+        for literal in (member, '~' + member):
+            clauses.extend(compile_clauses(constraints(formula_class, literal), bits))
+    return clauses
+
+
+# Checks if a bitmask satisfies compiled clauses, i.e. if its choice set passes TemporalFormula.is_consistent
+def satisfies(mask, clauses):
+    return all(mask & ones or ~mask & zeros for ones, zeros in clauses)
+
+
+# Propagates compiled clauses over a partial assignment, given as the bits assigned and their values: a clause with
+# a single open bit left forces it. Clauses with a bit in both ones and zeros always hold and are skipped. Returns
+# the extended assignment, or None if a clause fails
+def propagate(assigned, values, clauses):
+    changed = True
+    while changed:
+        changed = False
+        for ones, zeros in clauses:
+            if ones & zeros or values & ones or assigned & ~values & zeros:
+                continue
+            unassigned = (ones | zeros) & ~assigned
+            if unassigned == 0:
+                return None
+            if unassigned & (unassigned - 1) == 0:
+                assigned |= unassigned
+                if unassigned & ones:
+                    values |= unassigned
+                changed = True
+    return assigned, values
+
+
+# Yields the bitmasks of a cube (care, value) over width bits that satisfy compiled clauses, in increasing order, as
+# consistent_assignments restricted to the cube would return them. The clauses are propagated inside the cube and a
+# branch is dropped as soon as one fails, so only consistent masks are reached rather than every mask of the cube.
+# The open bits are decided from the highest down, 0 first
+def consistent_in(cube, width, clauses):
+    if cube is None:
+        return
+    full = (1 << width) - 1
+    stack = [cube]
+    while stack:
+        assignment = propagate(*stack.pop(), clauses)
+        if assignment is None:
+            continue
+        assigned, values = assignment
+        if assigned == full:
+            yield values
+            continue
+        bit = 1 << (full & ~assigned).bit_length() - 1
+        stack.append((assigned | bit, values | bit))
+        stack.append((assigned | bit, values))
+
+
+# Returns the consistent assignments of a closure with the given non-negated members, given those of the immediate
+# subformulas, which are their projections: the assignments of the subformulas are joined on their shared members,
+# the other members are assigned both ways and only the clauses spanning several subformulas are checked again.
+# With output, the assignments are appended to it as the last join produces them, in no particular order, and
+# nothing is returned; the joins before the last one are still held in memory
+def join_assignments(formula_class, members, children, output=None):
+    bits = {subformula: bit for bit, subformula in enumerate(members)}
+    candidates = [0]
+    scope = 0
+    child_scopes = []
+    joins = []
+    for child_members, child_masks in children:
+        positions = [bits[member] for member in child_members]
+        child_scope = 0
+        for position in positions:
+            child_scope |= 1 << position
+        child_scopes.append(child_scope)
+        shared = scope & child_scope
+        matching = {}
+        for mask in child_masks:
+            lifted = 0
+            for i, position in enumerate(positions):
+                if mask >> i & 1:
+                    lifted |= 1 << position
+            matching.setdefault(lifted & shared, []).append(lifted)
+        joins.append((shared, matching))
+        scope |= child_scope
+    for shared, matching in joins[:-1]:
+        candidates = [candidate | lifted for candidate in candidates
+                      for lifted in matching.get(candidate & shared, ())]
+    extras = [0]
+    for bit in range(len(members)):
+        if not scope >> bit & 1:
+            extras = extras + [extra | 1 << bit for extra in extras]
+
+    clauses = [(ones, zeros) for ones, zeros in closure_clauses(formula_class, members)
+               if not any((ones | zeros) & ~child_scope == 0 for child_scope in child_scopes)]
+    shared, matching = joins[-1] if joins != [] else (0, {0: [0]})
+    masks = (candidate | lifted | extra for candidate in candidates for lifted in matching.get(candidate & shared, ())
+             for extra in extras)
+    if output is None:
+        return array('Q', sorted(mask for mask in masks if satisfies(mask, clauses)))
+    for mask in masks:
+        if satisfies(mask, clauses):
+            output.append(mask)
+
+
+# Returns the consistent assignments of the closure of a parsed formula: (members, masks) with the non-negated
+# closure members in sorted order, as in ClosureIndex, and the increasing bitmasks over them of the choice sets
+# passing TemporalFormula.is_consistent. Subformulas are visited in the order recorded by the parser, so the
+# assignments of every subformula are cached and available before those of the formulas containing it.
+# computed maps the subformulas whose assignments are already known to them, e.g. from a checkpoint; progress is
+# called with the number of subformulas visited, their total and computed after each new join.
+# With output, e.g. an MCSStore, the masks of the formula itself are appended to it rather than returned, and are
+# neither cached nor reported to progress; (members, None) is returned
+def consistent_assignments(formula, computed=None, progress=None, output=None):
+    text = formula.formula
+    assignments = CACHE.get(('consistent', text))
+    if assignments is not None:
+        if output is None:
+            return assignments
+        output.extend(assignments[1])
+        return (assignments[0], None)
+    formula_class = type(formula)
+    computed = {} if computed is None else computed
+    for position, (start, end, connective) in enumerate(formula.subformulas):
+        subformula = text[start:end]
+        if subformula in computed:
+            continue
+        if connective != -1:
+            children = [text[start + 1:connective], text[connective + 1:end - 1]]
+        elif end - start > 1:
+            children = [text[start + 1:end]]
+        else:
+            children = []
+        assignments = CACHE.get(('consistent', subformula))
+        if assignments is None:
+            members = set()
+            for child in children:
+                members.update(computed[child][0])
+            # The closure adds the subformula and its negation; for ~A, A is the child and already a member
+            if not subformula.startswith('~'):
+                members.add(subformula)
+            members = tuple(sorted(members))
+            if subformula == text and output is not None:
+                join_assignments(formula_class, members, [computed[child] for child in children], output)
+                return (members, None)
+            masks = join_assignments(formula_class, members, [computed[child] for child in children])
+            assignments = (members, masks)
+            CACHE.put(('consistent', subformula), assignments, 1 + len(masks))
+            computed[subformula] = assignments
+            if progress is not None:
+                progress(position + 1, len(formula.subformulas), computed)
+        computed[subformula] = assignments
+    if output is None:
+        return computed[text]
+    output.extend(computed[text][1])
+    return (computed[text][0], None)
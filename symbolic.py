@@ -0,0 +1,266 @@
+from bdd import BDD
+
+# Symbolic engine shared by real-time.py and minkowski-spacetime.py.
+# Sets of maximal consistent sets and relations between them are binary decision diagrams over the non-negated
+# closure members. Three interleaved copies x, y and z of these variables are used: bit i of a set in copy c is
+# variable 3*level[i] + c, where members are ordered by their first occurrence in the formula so that subformulas
+# stay close to the formulas they come from. Since access is transitive, a cluster is represented by any of its
+# members: c<m for a cluster c holds iff r<m for a member r of c, and likewise for m<c and c<d.
+
+
+class SymbolicEngine:
+
+    def __init__(self, formula):
+        self.formula = formula
+        self.index = formula.get_closure_index()
+        self.width = len(self.index)
+        self.bdd = BDD(3 * self.width)
+        order = sorted(range(self.width), key=lambda bit: (formula.formula.find(self.index.members[bit]),
+                                                           -len(self.index.members[bit])))
+        self.level = [0] * self.width
+        for position, bit in enumerate(order):
+            self.level[bit] = position
+        self.copies = [frozenset(self.var(bit, copy) for bit in range(self.width)) for copy in range(3)]
+        self.relations = {}
+
+        bdd = self.bdd
+        consistent = self.build_consistent(0)
+        self.consistent = [consistent, bdd.rename(consistent, self.move((0, 1))),
+                           bdd.rename(consistent, self.move((0, 2)))]
+        self.reflexive = bdd.conj(self.consistent[0], self.access(0, 0))
+        self.irreflexive = bdd.conj(self.consistent[0], bdd.neg(self.access(0, 0)))
+
+        # Cluster membership: y is in the cluster of the reflexive set x
+        self.cluster = bdd.conj(self.reflexive, self.consistent[1], self.access(0, 1), self.access(1, 0))
+
+        # Element membership: y is in the cluster of x, or y is the irreflexive set x
+        self.member = bdd.disj(self.cluster, bdd.conj(self.irreflexive, self.equal(0, 1)))
+
+    # Returns the variable of a bit in a copy
+    def var(self, bit, copy):
+        return 3 * self.level[bit] + copy
+
+    # Returns the bitmask of a set in a copy from an assignment
+    def mask(self, assignment, copy):
+        return sum(1 << bit for bit in range(self.width) if assignment[self.var(bit, copy)])
+
+    # Returns the mapping that moves variables from one copy to another
+    def move(self, *pairs):
+        mapping = []
+        for source, target in pairs:
+            mapping.extend((3 * level + source, 3 * level + target) for level in range(self.width))
+        return tuple(mapping)
+
+    # Returns the function of a literal (bit, value) in a copy; None stands for a formula that is never in a set
+    def literal(self, literal, copy):
+        if literal is None:
+            return BDD.FALSE
+        bit, value = literal
+        v = self.bdd.variable(self.var(bit, copy))
+        return v if value else self.bdd.neg(v)
+
+    # Returns the function of a formula string being in a set of a copy
+    def holds(self, subformula, copy):
+        return self.literal(self.index.literal(subformula), copy)
+
+    # Returns the equality of the sets in two copies
+    def equal(self, a, b):
+        bdd = self.bdd
+        return bdd.conj(*[bdd.equiv(bdd.variable(3 * level + a), bdd.variable(3 * level + b))
+                          for level in range(self.width)])
+
+    # Builds the consistent choice sets of a copy from the constraints checked by TemporalFormula.is_consistent
+    def build_consistent(self, copy):
+        bdd = self.bdd
+        formula_class = type(self.formula)
+
+        def holds(subformula):
+            return self.holds(subformula, copy)
+
+        constraints = []
+        for member in self.index.members:
+            for choice in (member, '~' + member):
+                formula = formula_class(choice).expand()
+                string = formula.formula
+                violations = [holds("~HF" + string), holds("~GP" + string)]
+                for operator, dual in (("F", "G~"), ("P", "H~"), ("G", "F~"), ("H", "P~")):
+                    if string.startswith(operator):
+                        violations.append(holds(dual + string[1:]))
+                for operator, dual in (("~F", "~G~"), ("~P", "~H~"), ("~G", "~F~"), ("~H", "~P~")):
+                    if string.startswith(operator):
+                        violations.append(holds(dual + string[2:]))
+                if formula.conjunction() is not None:
+                    left = holds(formula.left_subformula().formula)
+                    right = holds(formula.right_subformula().formula)
+                    if formula.conjunction() == "|":
+                        violations.append(bdd.conj(bdd.neg(left), bdd.neg(right)))
+                    elif formula.conjunction() == "&":
+                        violations.append(bdd.disj(bdd.neg(left), bdd.neg(right)))
+                    elif formula.conjunction() == ">":
+                        violations.append(bdd.conj(left, bdd.neg(right)))
+                constraints.append(bdd.implies(holds(choice), bdd.neg(bdd.disj(*violations))))
+        return bdd.conj(*constraints)
+
+    # Returns the access relation m<n with m in copy a and n in copy b
+    def access(self, a, b):
+        if (a, b) not in self.relations:
+            bdd = self.bdd
+            copy = (a, b)
+            rules = [bdd.implies(self.literal(literal_a, copy[side_a]), self.literal(literal_b, copy[side_b]))
+                     for side_a, literal_a, side_b, literal_b in self.index.rules]
+            self.relations[(a, b)] = bdd.conj(*rules)
+        return self.relations[(a, b)]
+
+    # Returns the set of sets in copy 0 as a list of bitmasks, in increasing order
+    def masks(self, f, copy=0):
+        masks = []
+        for assignment in self.bdd.assignments(f, self.copies[copy]):
+            masks.append(self.mask(assignment, copy))
+        return sorted(masks)
+
+    # Returns the function of the set given by a bitmask in a copy
+    def point(self, mask, copy):
+        return self.bdd.conj(*[self.literal((bit, mask >> bit & 1), copy) for bit in range(self.width)])
+
+    # Returns the members of the element represented by a bitmask
+    def members(self, mask):
+        element = self.bdd.exists(self.bdd.conj(self.member, self.point(mask, 0)), self.copies[0])
+        return self.masks(element, 1)
+
+    # Returns the defects of the elements represented by copy 0 that are not cured within them, and the elements
+    # containing a cure, for each eventuality
+    def defects(self, eventualities):
+        bdd = self.bdd
+        defects = []
+        for defect, cure in eventualities:
+            has_defect = bdd.exists(bdd.conj(self.member, self.literal(defect, 1)), self.copies[1])
+            has_cure = bdd.exists(bdd.conj(self.member, self.literal(cure, 1)), self.copies[1])
+            cured = bdd.exists(bdd.conj(self.member, bdd.disj(self.literal(defect, 1), self.literal(cure, 1))),
+                               self.copies[1])
+            defects.append((bdd.conj(has_defect, bdd.neg(has_cure)), cured))
+        return defects
+
+    # Returns the relation between consecutive elements x and y of a model, as checked by find_next_mcs and
+    # find_next_cluster
+    def step(self):
+        bdd = self.bdd
+        swap = self.move((0, 1), (1, 0))
+        conditions = [self.access(0, 1),
+                      bdd.disj(bdd.conj(self.reflexive, bdd.rename(self.irreflexive, swap)),
+                               bdd.conj(self.irreflexive, bdd.rename(self.reflexive, swap)))]
+        for defect, cured in self.defects(self.index.future):
+            conditions.append(bdd.implies(defect, bdd.rename(cured, swap)))
+        for defect, cured in self.defects(self.index.past):
+            conditions.append(bdd.implies(bdd.rename(defect, swap), cured))
+        return bdd.conj(*conditions)
+
+    # Computes the layers of the least fixed point of the elements that reach a goal set via a relation
+    def reach(self, goal, relation):
+        bdd = self.bdd
+        swap = self.move((0, 1), (1, 0))
+        layers = [goal]
+        while True:
+            previous = bdd.exists(bdd.conj(relation, bdd.rename(layers[-1], swap)), self.copies[1])
+            layer = bdd.disj(layers[-1], previous)
+            if layer == layers[-1]:
+                return layers
+            layers.append(layer)
+
+    # Follows decreasing layers from an element to the goal, returning the bitmasks of the elements passed
+    def follow(self, mask, layers, relation):
+        bdd = self.bdd
+        swap = self.move((0, 1), (1, 0))
+        path = []
+        level = min(i for i, layer in enumerate(layers) if bdd.conj(layer, self.point(mask, 0)) != BDD.FALSE)
+        while level > 0:
+            current = bdd.exists(bdd.conj(relation, self.point(mask, 0)), self.copies[0])
+            candidates = bdd.conj(current, bdd.rename(layers[level - 1], swap))
+            assignment = bdd.pick(candidates, self.copies[1])
+            mask = self.mask(assignment, 1)
+            path.append(mask)
+            while level > 0 and bdd.conj(layers[level - 1], self.point(mask, 0)) != BDD.FALSE:
+                level -= 1
+        return path
+
+    # Computes a model in the format of get_model; returns False if no model exists
+    def get_model(self):
+        bdd = self.bdd
+        swap = self.move((0, 1), (1, 0))
+        step = self.step()
+        backward_step = bdd.rename(step, swap)
+
+        top = bdd.conj(self.reflexive, *[bdd.neg(defect) for defect, cured in self.defects(self.index.future)])
+        bottom = bdd.conj(self.reflexive, *[bdd.neg(defect) for defect, cured in self.defects(self.index.past)])
+        to_top = self.reach(top, step)
+        to_bottom = self.reach(bottom, backward_step)
+
+        # Clusters containing the formula from which both ends of the model can be reached
+        with_formula = bdd.exists(bdd.conj(self.cluster, self.holds(self.formula.formula, 1)), self.copies[1])
+        start = bdd.conj(with_formula, to_top[-1], to_bottom[-1])
+        assignment = bdd.pick(start, self.copies[0])
+        if assignment is None:
+            return False
+        mask = self.mask(assignment, 0)
+
+        elements = list(reversed(self.follow(mask, to_bottom, backward_step))) + [mask]
+        elements += self.follow(mask, to_top, step)
+
+        model = []
+        for element in elements:
+            if bdd.conj(self.reflexive, self.point(element, 0)) != BDD.FALSE:
+                model.append([self.index.decode(member) for member in self.members(element)])
+            else:
+                model.append(self.index.decode(element))
+        return model
+
+    # Checks the successor-count conditions of the Minkowski check_sat
+    def check_sat(self):
+        bdd = self.bdd
+        with_formula = bdd.conj(self.consistent[0], self.holds(self.formula.formula, 0))
+        if with_formula == BDD.FALSE:
+            return False
+
+        # successor(c, m): c<m and every set z outside c and m with c<z<m satisfies z<c and m<z
+        member_z = bdd.rename(self.member, self.move((1, 2)))
+        member_yz = bdd.rename(self.member, self.move((0, 1), (1, 2)))
+        between = bdd.conj(self.consistent[2], bdd.neg(member_z), bdd.neg(member_yz),
+                           self.access(0, 2), self.access(2, 1),
+                           bdd.neg(bdd.conj(self.access(2, 0), self.access(1, 2))))
+        successor = bdd.conj(self.access(0, 1), bdd.neg(bdd.exists(between, self.copies[2])))
+        predecessor = bdd.rename(successor, self.move((0, 1), (1, 0)))
+
+        # Clusters are counted by their least member
+        less = BDD.FALSE
+        for bit in range(self.width):
+            z, y = bdd.variable(self.var(bit, 2)), bdd.variable(self.var(bit, 1))
+            less = bdd.disj(bdd.conj(bdd.neg(z), y), bdd.conj(bdd.equiv(z, y), less))
+        cluster_yz = bdd.rename(self.cluster, self.move((1, 2), (0, 1)))
+        least = bdd.conj(bdd.rename(self.reflexive, self.move((0, 1))),
+                         bdd.neg(bdd.exists(bdd.conj(cluster_yz, less), self.copies[2])))
+        irreflexive_y = bdd.rename(self.irreflexive, self.move((0, 1)))
+
+        def count(relation, mask, kind):
+            return bdd.count(bdd.exists(bdd.conj(relation, self.point(mask, 0), kind), self.copies[0]),
+                             self.copies[1])
+
+        # Irreflexive sets after a set containing the formula, and after some set
+        after_formula = bdd.exists(bdd.conj(with_formula, self.access(0, 1)), self.copies[0])
+        after_some = bdd.exists(bdd.conj(self.consistent[0], self.access(0, 1)), self.copies[0])
+        swap = self.move((0, 1), (1, 0))
+        m_irref = bdd.conj(self.irreflexive, bdd.rename(bdd.conj(after_formula, after_some), swap))
+        for n in self.masks(m_irref):
+            if count(successor, n, least) not in {1, 2}:
+                return False
+            if count(predecessor, n, least) not in {1, 2}:
+                return False
+
+        # Irreflexive sets after a set that comes after a set containing the formula
+        middle = bdd.rename(bdd.conj(after_formula, self.consistent[1]), self.move((1, 2)))
+        after_after = bdd.exists(bdd.conj(middle, self.access(2, 1)), self.copies[2])
+        m_clusters = bdd.conj(self.irreflexive, bdd.rename(after_after, swap))
+        for n in self.masks(m_clusters):
+            cluster_successors = count(successor, n, least)
+            if count(successor, n, irreflexive_y) + cluster_successors > 2:
+                if cluster_successors != 0:
+                    return False
+        return True